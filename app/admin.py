@@ -1,9 +1,17 @@
-from dataclasses import dataclass
-from typing import Any, Dict, List
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
 
-from flask import Blueprint, render_template, request
+from flask import Blueprint, abort, render_template, request
+from sqlalchemy import text
 
-from .db import execute, get_columns, query
+from .changes import FETCH_CHUNK, delete_row, delete_rows, insert_row, update_row, update_rows, upsert_rows
+from .db import is_read_only, query, write_transaction
+from .refdata import get_reference_data
+from .schema import get_table
 
 bp = Blueprint("admin", __name__, template_folder="templates")
 
@@ -21,6 +29,7 @@ TABLE_LABELS = {
     "simulants": "Simulants",
     "food_category_simulants": "Category ↔ simulant links",
     "substances": "Authorised substances",
+    "regulations": "Regulations",
     "sm_entries": "Specific migration entries",
     "group_restrictions": "Group restrictions",
     "sm_entry_group_restrictions": "SM entry ↔ group links",
@@ -29,6 +38,19 @@ TABLE_LABELS = {
 }
 
 
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+# How rows of a referenced table are labelled in foreign-key dropdowns.
+REFERENCE_LABELS = {
+    "food_categories": "{ref_no} · {description}",
+    "simulants": "{abbreviation} · {name}",
+    "substances": "CAS {cas_no} · FCM {fcm_no}",
+    "regulations": "{code}",
+    "sm_entries": "#{id} · FCM {fcm_no}",
+    "group_restrictions": "#{id} · {group_sml} {unit}",
+}
+
+
 @dataclass
 class Column:
     name: str
@@ -36,38 +58,167 @@ class Column:
     pk: bool
     nullable: bool
     enum_values: List[str]
+    kind: str = "text"
+    length: Optional[int] = None
+    # (value, label) pairs for foreign-key columns.
+    options: List[Tuple[Any, str]] = field(default_factory=list)
+    # (table, column) a foreign-key column points at.
+    references: Optional[Tuple[str, str]] = None
+
+
+def reference_options(table: str, column: str) -> List[Tuple[Any, str]]:
+    template = REFERENCE_LABELS.get(table, "{%s}" % column)
+    return [(row[column], template.format(**row)) for row in get_reference_data().rows(table)]
 
 
 def load_columns(table: str) -> List[Column]:
     columns: List[Column] = []
-    for col in get_columns(table):
-        col_type = col["type"].lower()
-        form_type = "text"
-        if col["name"] in BOOL_COLUMNS or "int" in col_type and col["name"].startswith("is_"):
-            form_type = "bool"
+    for info in get_table(table).columns:
+        kind = "bool" if info.name in BOOL_COLUMNS else info.kind
+        form_type = "bool" if kind == "bool" else "text"
+        options: List[Tuple[Any, str]] = []
+        references = None
+        if info.references and info.references[0] in TABLE_LABELS:
+            form_type = "fk"
+            references = info.references
+            options = reference_options(*references)
         columns.append(
             Column(
-                name=col["name"],
+                name=info.name,
                 type=form_type,
-                pk=bool(col.get("primary_key")),
-                nullable=col.get("nullable", True),
+                pk=info.primary_key,
+                nullable=info.nullable,
                 enum_values=[],
+                kind=kind,
+                length=info.length,
+                options=options,
+                references=references,
             )
         )
     return columns
 
 
 def parse_value(raw: Any, col: Column) -> Any:
+    """
+    Convert a form value to the column's type, raising ValueError on invalid input.
+    """
     if col.type == "bool":
-        return 1 if str(raw) == "1" else 0
-    if raw == "" and col.nullable:
-        return None
-    return raw
+        return 1 if str(raw).strip().lower() in TRUE_VALUES else 0
+    raw = "" if raw is None else str(raw).strip()
+    if raw == "":
+        if col.nullable:
+            return None
+        raise ValueError(f"{col.name} is required.")
+    if col.kind == "int":
+        try:
+            value: Any = int(raw)
+        except ValueError:
+            raise ValueError(f"{col.name} must be a whole number, got {raw!r}.") from None
+    elif col.kind == "decimal":
+        try:
+            value = Decimal(raw)
+        except InvalidOperation:
+            raise ValueError(f"{col.name} must be a number, got {raw!r}.") from None
+    else:
+        value = raw
+        if col.length is not None and len(value) > col.length:
+            raise ValueError(f"{col.name} is limited to {col.length} characters.")
+    return value
+
+
+def check_references(conn, columns: List[Column], rows: List[Dict[str, Any]]) -> None:
+    """
+    Raise ValueError if a foreign-key value in `rows` names no existing row.
+
+    Runs on the write transaction's connection: the dropdown options come from the
+    reference-data cache, which can lag a write made moments ago on another worker.
+    """
+    for col in columns:
+        if col.references is None:
+            continue
+        wanted = list(dict.fromkeys(row[col.name] for row in rows if row.get(col.name) is not None))
+        ref_table, ref_column = col.references
+        found = set()
+        for start in range(0, len(wanted), FETCH_CHUNK):
+            chunk = wanted[start:start + FETCH_CHUNK]
+            placeholders = ", ".join(f":v{i}" for i in range(len(chunk)))
+            result = conn.execute(
+                text(f"SELECT {ref_column} FROM {ref_table} WHERE {ref_column} IN ({placeholders})"),
+                {f"v{i}": value for i, value in enumerate(chunk)},
+            )
+            found.update(row[0] for row in result)
+        for value in wanted:
+            if value not in found:
+                raise ValueError(f"{col.name} {str(value)!r} does not match any existing row.")
+
+
+def parse_key(raw: Dict[str, Any], columns: List[Column]) -> Dict[str, Any]:
+    return {col.name: parse_value(raw.get(col.name), col) for col in columns if col.pk}
+
+
+def read_bulk_rows(columns: List[Column]) -> List[Dict[str, Any]]:
+    """
+    Rows pasted into the bulk textarea or uploaded as a CSV file, header row first.
+
+    Only the columns named in the header are written; errors name the CSV line.
+    """
+    upload = request.files.get("csv_file")
+    raw = upload.read().decode("utf-8-sig") if upload and upload.filename else request.form.get("csv", "")
+    reader = csv.DictReader(io.StringIO(raw.strip()))
+    by_name = {col.name: col for col in columns}
+    unknown = [name for name in reader.fieldnames or [] if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}.")
+    rows = []
+    for record in reader:
+        if None in record:
+            # DictReader files fields beyond the header under the None key.
+            raise ValueError(
+                f"Line {reader.line_num}: {len(reader.fieldnames) + len(record[None])} fields, "
+                f"but the header names {len(reader.fieldnames)}."
+            )
+        try:
+            rows.append(
+                {
+                    name: parse_value(value, by_name[name])
+                    for name, value in record.items()
+                    # Blank auto-increment keys mean "insert a new row".
+                    if not (by_name[name].pk and (value or "").strip() == "")
+                }
+            )
+        except ValueError as exc:
+            raise ValueError(f"Line {reader.line_num}: {exc}") from None
+    if not rows:
+        raise ValueError("No rows to import.")
+    return rows
+
+
+def selected_keys(columns: List[Column]) -> List[Dict[str, Any]]:
+    pk_columns = [col for col in columns if col.pk]
+    keys = []
+    for raw in request.form.getlist("selected"):
+        values = json.loads(raw)
+        keys.append(parse_key(dict(zip([col.name for col in pk_columns], values)), columns))
+    if not keys:
+        raise ValueError("Select at least one row.")
+    return keys
+
+
+def row_key(row: Dict[str, Any], columns: List[Column]) -> str:
+    return json.dumps([row[col.name] for col in columns if col.pk], default=str)
+
+
+@bp.before_request
+def reject_read_only():
+    if is_read_only():
+        return "The editor is unavailable on read-only snapshot instances.", 403
 
 
 @bp.route("/", methods=["GET", "POST"])
 def index():
     table_key = request.values.get("table") or next(iter(TABLE_LABELS))
+    if table_key not in TABLE_LABELS:
+        abort(404)
     message = None
     error = None
     columns = load_columns(table_key)
@@ -76,49 +227,63 @@ def index():
         action = request.form.get("action")
         try:
             if action == "create":
-                insert_cols = []
                 params: Dict[str, Any] = {}
                 for col in columns:
                     val = request.form.get(col.name, "")
                     if col.pk and val == "":
                         continue
-                    insert_cols.append(col.name)
                     params[col.name] = parse_value(val, col)
-                placeholders = ", ".join(f":{col}" for col in insert_cols)
-                execute(
-                    f"INSERT INTO {table_key} ({', '.join(insert_cols)}) VALUES ({placeholders})",
-                    params,
-                )
+                with write_transaction(bump_version=True) as conn:
+                    check_references(conn, columns, [params])
+                    insert_row(conn, table_key, params)
                 message = "Row added."
             elif action == "update":
-                pk_parts: List[str] = []
-                set_parts: List[str] = []
-                params: Dict[str, Any] = {}
+                key: Dict[str, Any] = {}
+                values: Dict[str, Any] = {}
                 for col in columns:
                     val = request.form.get(col.name, "")
                     if col.pk:
-                        pk_parts.append(f"{col.name} = :pk_{col.name}")
-                        params[f"pk_{col.name}"] = parse_value(val, col)
+                        key[col.name] = parse_value(val, col)
                     else:
-                        set_parts.append(f"{col.name} = :{col.name}")
-                        params[col.name] = parse_value(val, col)
-                if pk_parts:
-                    execute(
-                        f"UPDATE {table_key} SET {', '.join(set_parts)} WHERE {' AND '.join(pk_parts)}",
-                        params,
-                    )
+                        values[col.name] = parse_value(val, col)
+                if key:
+                    with write_transaction(bump_version=True) as conn:
+                        check_references(conn, columns, [values])
+                        update_row(conn, table_key, key, values)
                     message = "Row updated."
             elif action == "delete":
-                pk_parts: List[str] = []
-                params: Dict[str, Any] = {}
+                key = {}
                 for col in columns:
                     if col.pk:
-                        val = request.form.get(col.name)
-                        pk_parts.append(f"{col.name} = :{col.name}")
-                        params[col.name] = parse_value(val, col)
-                if pk_parts:
-                    execute(f"DELETE FROM {table_key} WHERE {' AND '.join(pk_parts)}", params)
+                        key[col.name] = parse_value(request.form.get(col.name), col)
+                if key:
+                    with write_transaction(bump_version=True) as conn:
+                        delete_row(conn, table_key, key)
                     message = "Row deleted."
+            # Bulk actions run in one transaction with a single data-version bump.
+            elif action == "bulk_import":
+                bulk_rows = read_bulk_rows(columns)
+                with write_transaction(bump_version=True) as conn:
+                    check_references(conn, columns, bulk_rows)
+                    inserted, updated, unchanged = upsert_rows(conn, table_key, bulk_rows)
+                message = f"Imported {len(bulk_rows)} rows: {inserted} added, {updated} updated"
+                message += f", {unchanged} already present." if unchanged else "."
+            elif action == "bulk_delete":
+                keys = selected_keys(columns)
+                with write_transaction(bump_version=True) as conn:
+                    deleted = delete_rows(conn, table_key, keys)
+                message = f"Deleted {deleted} rows."
+            elif action == "bulk_update":
+                keys = selected_keys(columns)
+                by_name = {col.name: col for col in columns}
+                target = by_name.get(request.form.get("column", ""))
+                if target is None or target.pk:
+                    raise ValueError("Choose a non-key column to update.")
+                value = parse_value(request.form.get("value", ""), target)
+                with write_transaction(bump_version=True) as conn:
+                    check_references(conn, [target], [{target.name: value}])
+                    update_rows(conn, table_key, [(key, {target.name: value}) for key in keys])
+                message = f"Set {target.name} on {len(keys)} rows."
         except Exception as exc:  # pragma: no cover - tiny admin helper
             error = str(exc)
 
@@ -132,6 +297,7 @@ def index():
         tables=tables,
         table_key=table_key,
         rows=rows,
+        row_keys=[row_key(row, columns) for row in rows],
         columns=columns,
         message=message,
         error=error,
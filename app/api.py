@@ -1,16 +1,35 @@
-import json
 from typing import Any, Dict, List
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, redirect, request, url_for
 
-from .db import execute, query
+from . import changes, favorites
+from .assets import IMMUTABLE_MAX_AGE
+from .bundle import bundle_response, get_bundle, regulation_args
+from .charts import get_chart_data
+from .db import is_read_only, query
+from .plans import build_plan, inputs_from_plan, normalize_plan_inputs
+from .regulations import list_regulations, payload_regulation, resolve_regulation
+from .responses import json_body_response, json_response
+from .singleflight import coalesced_json
 
 bp = Blueprint("api", __name__)
-UNLISTED_SUBSTANCE_CAS = "UNLISTED_SUBSTANCE"
+
+
+def unknown_regulation():
+    return jsonify({"error": "unknown regulation"}), 404
+
+
+@bp.route("/regulations")
+def regulations():
+    return json_response(list_regulations())
 
 
 @bp.route("/foods")
 def foods():
+    return json_body_response(coalesced_json("foods", None, load_foods))
+
+
+def load_foods() -> List[Dict[str, Any]]:
     foods = query(
         """
         SELECT f.id, f.name, fc.id as category_id, fc.ref_no, fc.description, fc.frf, fc.acidic
@@ -41,7 +60,7 @@ def foods():
                 "simulants": [dict(sim) for sim in simulants],
             }
         )
-    return jsonify(payload)
+    return payload
 
 
 @bp.route("/foods/<int:food_id>")
@@ -67,7 +86,7 @@ def food(food_id: int):
         """,
         {"cat_id": row["category_id"]},
     )
-    return jsonify(
+    return json_response(
         {
             "id": row["id"],
             "name": row["name"],
@@ -82,13 +101,34 @@ def food(food_id: int):
 
 @bp.route("/substances")
 def substances():
-    rows = query("SELECT id, cas_no, fcm_no, ec_ref_no FROM substances ORDER BY cas_no")
-    return jsonify([dict(r) for r in rows])
+    if "regulation" not in request.args:
+        rows = query("SELECT id, cas_no, fcm_no, ec_ref_no FROM substances ORDER BY cas_no")
+        return json_response([dict(r) for r in rows])
+    regulation_id = resolve_regulation(request.args["regulation"])
+    if regulation_id is None:
+        return unknown_regulation()
+    # Substances listed in one regulation, read through its (regulation_id, substance_id) index.
+    rows = query(
+        """
+        SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no
+        FROM substances s
+        WHERE EXISTS (
+          SELECT 1 FROM sm_entries se WHERE se.regulation_id = :regulation_id AND se.substance_id = s.id
+        )
+        ORDER BY s.cas_no
+        """,
+        {"regulation_id": regulation_id},
+    )
+    return json_response([dict(r) for r in rows])
 
 
 @bp.route("/suggest/foods")
 def suggest_foods():
     q = (request.args.get("q") or "").strip()
+    return json_body_response(coalesced_json("suggest_foods", q, lambda: load_food_suggestions(q)))
+
+
+def load_food_suggestions(q: str) -> List[Dict[str, Any]]:
     like = f"%{q}%"
     rows = query(
         """
@@ -101,295 +141,163 @@ def suggest_foods():
         """,
         {"like": like},
     )
-    return jsonify(
-        [
-            {
-                "id": row["id"],
-                "label": f"{row['name']} (Annex III {row['ref_no']})",
-                "ref_no": row["ref_no"],
-                "name": row["name"],
-            }
-            for row in rows
-        ]
-    )
+    return [
+        {
+            "id": row["id"],
+            "label": f"{row['name']} (Annex III {row['ref_no']})",
+            "ref_no": row["ref_no"],
+            "name": row["name"],
+        }
+        for row in rows
+    ]
 
 
 @bp.route("/suggest/substances")
 def suggest_substances():
     q = (request.args.get("q") or "").strip()
+    regulation_id = resolve_regulation(request.args.get("regulation"))
+    if regulation_id is None:
+        return unknown_regulation()
+    return json_body_response(
+        coalesced_json(
+            "suggest_substances",
+            {"q": q, "regulation_id": regulation_id},
+            lambda: load_substance_suggestions(q, regulation_id),
+        )
+    )
+
+
+def load_substance_suggestions(q: str, regulation_id: int) -> List[Dict[str, Any]]:
+    # Only substances the plan can look up; anything else goes in as a custom CAS number.
     like = f"%{q}%"
     rows = query(
         """
-        SELECT id, cas_no, fcm_no, ec_ref_no
-        FROM substances
-        WHERE cas_no LIKE :like OR CAST(fcm_no AS CHAR) LIKE :like OR CAST(ec_ref_no AS CHAR) LIKE :like
-        ORDER BY cas_no
+        SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no
+        FROM substances s
+        WHERE (s.cas_no LIKE :like OR CAST(s.fcm_no AS CHAR) LIKE :like OR CAST(s.ec_ref_no AS CHAR) LIKE :like)
+          AND EXISTS (
+            SELECT 1 FROM sm_entries se WHERE se.regulation_id = :regulation_id AND se.substance_id = s.id
+          )
+        ORDER BY s.cas_no
         LIMIT 8
         """,
-        {"like": like},
-    )
-    return jsonify(
-        [
-            {
-                "id": row["id"],
-                "label": f"CAS {row['cas_no']} · FCM {row['fcm_no']} · EC {row['ec_ref_no']}",
-                "cas_no": row["cas_no"],
-            }
-            for row in rows
-        ]
+        {"like": like, "regulation_id": regulation_id},
     )
+    return [
+        {
+            "id": row["id"],
+            "label": f"CAS {row['cas_no']} · FCM {row['fcm_no']} · EC {row['ec_ref_no']}",
+            "cas_no": row["cas_no"],
+        }
+        for row in rows
+    ]
 
 
 @bp.route("/generate-plan", methods=["POST"])
 def generate_plan():
     payload = request.get_json(silent=True) or {}
-    food_ids = payload.get("food_ids") or []
-    substance_ids = payload.get("substance_ids") or []
-    custom_cas_numbers = []
-    for raw in payload.get("custom_cas_numbers") or []:
-        cas_no = str(raw).strip()
-        if cas_no and cas_no not in custom_cas_numbers:
-            custom_cas_numbers.append(cas_no)
-    worst_case_time_input = payload.get("worst_case_time_minutes")
-    worst_case_temp_input = payload.get("worst_case_temp_celsius")
-    condition_inputs = payload.get("conditions")
-
-    def coerce_int(val):
-        try:
-            return int(val)
-        except (TypeError, ValueError):
-            return None
-
-    foods = []
-    if food_ids:
-        placeholders = ", ".join(f":food_id_{i}" for i in range(len(food_ids)))
-        rows = query(
-            f"""
-            SELECT f.id, f.name, fc.id as category_id, fc.ref_no, fc.description, fc.frf, fc.acidic
-            FROM foods f
-            JOIN food_categories fc ON fc.id = f.food_category_id
-            WHERE f.id IN ({placeholders})
-            """,
-            {f"food_id_{i}": fid for i, fid in enumerate(food_ids)},
-        )
-        for row in rows:
-            simulants = query(
-                """
-                SELECT s.name, s.abbreviation
-                FROM simulants s
-                JOIN food_category_simulants fcs ON fcs.simulant_id = s.id
-                WHERE fcs.food_category_id = :cat_id
-                """,
-                {"cat_id": row["category_id"]},
-            )
-            foods.append(
-                {
-                    "id": row["id"],
-                    "name": row["name"],
-                    "ref_no": row["ref_no"],
-                    "description": row["description"],
-                    "frf": row["frf"],
-                    "acidic": bool(row["acidic"]),
-                    "simulants": [dict(sim) for sim in simulants],
-                }
-            )
-
-    def to_bool(val):
-        return bool(val) if val is not None else None
-
-    def get_group_limits(sm_entry_id):
-        if not sm_entry_id:
-            return []
-        return query(
-            """
-            SELECT gr.id AS group_restriction_id, gr.group_sml, gr.unit, gr.specification
-            FROM group_restrictions gr
-            JOIN sm_entry_group_restrictions sgr ON sgr.group_restriction_id = gr.id
-            WHERE sgr.sm_id = :sm_id
-            """,
-            {"sm_id": sm_entry_id},
-        )
-
-    def serialize_substance(row, *, unique_key, cas_override=None, extra=None):
-        group_limits = get_group_limits(row.get("sm_entry_id"))
-        payload = {
-            "id": row.get("id"),
-            "cas_no": cas_override if cas_override is not None else row.get("cas_no"),
-            "fcm_no": row.get("fcm_no"),
-            "ec_ref_no": row.get("ec_ref_no"),
-            "use_as_additive_or_ppa": to_bool(row.get("use_as_additive_or_ppa")),
-            "use_as_monomer_or_starting_substance": to_bool(row.get("use_as_monomer_or_starting_substance")),
-            "frf_applicable": to_bool(row.get("frf_applicable")),
-            "sml": row.get("sml"),
-            "restrictions_and_specifications": row.get("restrictions_and_specifications"),
-            "group_limits": [dict(gl) for gl in group_limits],
-            "unique_key": unique_key,
-        }
-        if extra:
-            payload.update(extra)
-        return payload
-
-    substances_details = []
-    if substance_ids:
-        placeholders = ", ".join(f":sub_id_{i}" for i in range(len(substance_ids)))
-        subs = query(
-            f"""
-            SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no,
-                   se.id AS sm_entry_id,
-                   se.use_as_additive_or_ppa,
-                   se.use_as_monomer_or_starting_substance,
-                   se.frf_applicable,
-                   se.sml,
-                   se.restrictions_and_specifications
-            FROM substances s
-            LEFT JOIN sm_entries se ON se.substance_id = s.id
-            WHERE s.id IN ({placeholders})
-            """,
-            {f"sub_id_{i}": sid for i, sid in enumerate(substance_ids)},
-        )
-        for row in subs:
-            substances_details.append(serialize_substance(row, unique_key=f"db:{row['id']}"))
-
-    def load_unlisted_template():
-        rows = query(
-            """
-            SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no,
-                   se.id AS sm_entry_id,
-                   se.use_as_additive_or_ppa,
-                   se.use_as_monomer_or_starting_substance,
-                   se.frf_applicable,
-                   se.sml,
-                   se.restrictions_and_specifications
-            FROM substances s
-            LEFT JOIN sm_entries se ON se.substance_id = s.id
-            WHERE s.cas_no = :cas_no
-            LIMIT 1
-            """,
-            {"cas_no": UNLISTED_SUBSTANCE_CAS},
-        )
-        if rows:
-            return serialize_substance(rows[0], unique_key="unlisted-template")
-        return {
-            "id": None,
-            "cas_no": UNLISTED_SUBSTANCE_CAS,
-            "fcm_no": None,
-            "ec_ref_no": None,
-            "use_as_additive_or_ppa": None,
-            "use_as_monomer_or_starting_substance": None,
-            "frf_applicable": None,
-            "sml": 0.01,
-            "restrictions_and_specifications": "Default limit for non-listed substances.",
-            "group_limits": [],
-            "unique_key": "unlisted-template",
-        }
-
-    if custom_cas_numbers:
-        base_unlisted = load_unlisted_template()
-        for cas_no in custom_cas_numbers:
-            substances_details.append(
-                {
-                    **base_unlisted,
-                    "cas_no": cas_no,
-                    "unique_key": f"custom:{cas_no}",
-                    "unlisted_fallback": True,
-                    "source_substance_id": base_unlisted.get("id"),
-                    "source_substance_cas": base_unlisted.get("cas_no"),
-                    "group_limits": [dict(gl) for gl in base_unlisted.get("group_limits", [])],
-                }
-            )
-
-    time_conditions = [dict(row) for row in query("SELECT * FROM sm_time_conditions ORDER BY worst_case_time_minutes")]
-    temp_conditions = [dict(row) for row in query("SELECT * FROM sm_temp_conditions ORDER BY worst_case_temp_celsius")]
-
-    def pick_condition(value, rows, key):
-        if value is None or not rows:
-            return None
-        for row in rows:
-            if value <= row[key]:
-                return row
-        return rows[-1]
-
-    # Support both the legacy single time/temp payload and the new multi-row payload.
-    if isinstance(condition_inputs, list):
-        raw_conditions = condition_inputs
-    else:
-        raw_conditions = [
-            {
-                "worst_case_time_minutes": worst_case_time_input,
-                "worst_case_temp_celsius": worst_case_temp_input,
-            }
-        ]
-
-    condition_results = []
-    for cond in raw_conditions:
-        wc_time_val = coerce_int(cond.get("worst_case_time_minutes"))
-        wc_temp_val = coerce_int(cond.get("worst_case_temp_celsius"))
-        input_time_raw = coerce_int(cond.get("input_time_raw"))
-        input_time_unit = cond.get("input_time_unit") or "minutes"
-        condition_results.append(
-            {
-                "worst_case_time_minutes": wc_time_val,
-                "worst_case_temp_celsius": wc_temp_val,
-                "input_time_raw": input_time_raw if input_time_raw is not None else wc_time_val,
-                "input_time_unit": input_time_unit or "minutes",
-                "selected_time_condition": pick_condition(wc_time_val, time_conditions, "worst_case_time_minutes"),
-                "selected_temp_condition": pick_condition(wc_temp_val, temp_conditions, "worst_case_temp_celsius"),
-            }
-        )
-
-    # Keep legacy keys for backward compatibility (first row only).
-    first_cond = condition_results[0] if condition_results else {"worst_case_time_minutes": None, "worst_case_temp_celsius": None, "selected_time_condition": None, "selected_temp_condition": None}
-
-    return jsonify(
-        {
-            "foods": foods,
-            "substances": substances_details,
-            "time_conditions": time_conditions,
-            "temp_conditions": temp_conditions,
-            "conditions": condition_results,
-            "selected_time_condition": first_cond["selected_time_condition"],
-            "selected_temp_condition": first_cond["selected_temp_condition"],
-            "worst_case_time_minutes": first_cond["worst_case_time_minutes"],
-            "worst_case_temp_celsius": first_cond["worst_case_temp_celsius"],
-        }
-    )
+    regulation_id = payload_regulation(payload)
+    if regulation_id is None:
+        return unknown_regulation()
+    inputs = normalize_plan_inputs({**payload, "regulation_id": regulation_id})
+    return json_body_response(coalesced_json("generate_plan", inputs, lambda: build_plan(inputs)))
 
 
 @bp.route("/favorites", methods=["GET"])
 def list_favorites():
-    rows = query("SELECT id, name, created_at FROM plan_favorites ORDER BY created_at DESC")
-    return jsonify(rows)
+    limit = request.args.get("limit", favorites.DEFAULT_PAGE_SIZE, type=int)
+    before = request.args.get("before", type=int)
+    rows, next_before = favorites.list_favorites(limit, before)
+    # The body stays the bare list it has always been; the next page is announced in headers.
+    response = jsonify(rows)
+    if next_before is not None:
+        response.headers["X-Next-Before"] = str(next_before)
+        next_url = url_for("api.list_favorites", limit=limit, before=next_before)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
 
 
 @bp.route("/favorites/<int:fav_id>", methods=["GET"])
 def get_favorite(fav_id: int):
-    rows = query(
-        "SELECT id, name, payload, created_at FROM plan_favorites WHERE id = :id",
-        {"id": fav_id},
-    )
-    if not rows:
+    favorite = favorites.get_favorite(fav_id)
+    if favorite is None:
         return jsonify({"error": "not found"}), 404
-    row = rows[0]
-    try:
-        payload = json.loads(row["payload"])
-    except Exception:
-        payload = None
-    return jsonify({"id": row["id"], "name": row["name"], "created_at": row["created_at"], "plan": payload})
+    return json_response(favorite)
 
 
 @bp.route("/favorites", methods=["POST"])
 def create_favorite():
+    if is_read_only():
+        return jsonify({"error": "favorites cannot be saved on a read-only snapshot"}), 403
     payload = request.get_json(silent=True) or {}
     name = (payload.get("name") or "").strip()
-    plan = payload.get("plan")
     if not name:
         return jsonify({"error": "name is required"}), 400
-    if plan is None:
+    if isinstance(payload.get("inputs"), dict):
+        regulation_id = payload_regulation(payload["inputs"])
+        if regulation_id is None:
+            return unknown_regulation()
+        inputs = normalize_plan_inputs({**payload["inputs"], "regulation_id": regulation_id})
+    elif isinstance(payload.get("plan"), dict):
+        if payload_regulation(payload["plan"]) is None:
+            return unknown_regulation()
+        inputs = inputs_from_plan(payload["plan"])
+    else:
         return jsonify({"error": "plan payload is required"}), 400
-    execute(
-        "INSERT INTO plan_favorites (name, payload) VALUES (:name, :payload)",
-        {"name": name, "payload": json.dumps(plan)},
-    )
-    # Return updated list for convenience.
-    rows = query("SELECT id, name, created_at FROM plan_favorites ORDER BY created_at DESC")
-    return jsonify(rows), 201
+    favorite, created = favorites.create_favorite(name, inputs)
+    if favorite is None:
+        return jsonify({"error": "an identical favorite was saved and removed concurrently; try again"}), 409
+    if not created:
+        # Deduplicated by content: say under which name the plan is already stored.
+        return jsonify({**favorite, "duplicate": True, "message": f'Already saved as "{favorite["name"]}".'}), 200
+    return jsonify({**favorite, "duplicate": False}), 201
+
+
+@bp.route("/changes")
+def list_changes():
+    if is_read_only():
+        return jsonify({"error": "the change feed is not available on read-only snapshots"}), 404
+    since = request.args.get("since", type=int)
+    if since is None:
+        # Starting point for clients that just did a full download.
+        return jsonify({"since": None, "version": changes.current_change_version(), "has_more": False, "tables": {}})
+    limit = request.args.get("limit", changes.DEFAULT_PAGE_SIZE, type=int)
+    return json_response(changes.changes_since(since, limit))
+
+
+@bp.route("/charts")
+def charts():
+    data = get_chart_data()
+    response = json_response(data)
+    # Revalidate on every use; unchanged data answers 304 until the data version moves.
+    response.set_etag(f"charts-{data['version']}")
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@bp.route("/bundle")
+def bundle():
+    regulation_id = resolve_regulation(request.args.get("regulation"))
+    if regulation_id is None:
+        return unknown_regulation()
+    response = bundle_response(get_bundle(regulation_id))
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@bp.route("/bundle/<digest>")
+def bundle_versioned(digest: str):
+    regulation_id = resolve_regulation(request.args.get("regulation"))
+    if regulation_id is None:
+        return unknown_regulation()
+    current = get_bundle(regulation_id)
+    if digest != current.digest:
+        # Pages rendered before the last write ask for an old digest; send them the current data.
+        return redirect(
+            url_for("api.bundle_versioned", digest=current.digest, **regulation_args(regulation_id))
+        )
+    response = bundle_response(current)
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
@@ -0,0 +1,232 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`python -m app.assets build` copies everything under static/ and docs/ into the build
+directory as `<name>.<hash><ext>`, writes `.gz`/`.br` siblings for text assets and a
+manifest.json. At runtime the manifest is loaded once; without a build the sources are
+hashed at startup and served uncompressed, so development needs no extra step.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import re
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask import Flask, abort, current_app, request, send_file, url_for
+
+from .responses import brotli, choose_encoding
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ASSET_ROOTS = ("static", "docs")
+DEFAULT_BUILD_DIR = BASE_DIR / "build" / "assets"
+MANIFEST_NAME = "manifest.json"
+PRECOMPRESS_SUFFIXES = {".css", ".js", ".json", ".svg", ".txt", ".html", ".map"}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# /docs/ URLs are not fingerprinted, so they only get a day before revalidating.
+DOCS_MAX_AGE = 24 * 3600
+
+
+@dataclass
+class Asset:
+    logical: str
+    url_name: str
+    path: Path
+    etag: str
+    mimetype: str
+    encoded: Dict[str, Path] = field(default_factory=dict)
+
+
+@dataclass
+class AssetRegistry:
+    by_logical: Dict[str, Asset]
+    by_url: Dict[str, Asset]
+
+    @classmethod
+    def from_assets(cls, assets) -> "AssetRegistry":
+        assets = list(assets)
+        return cls({a.logical: a for a in assets}, {a.url_name: a for a in assets})
+
+
+def fingerprint(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def fingerprinted_name(logical: str, digest: str) -> str:
+    path = Path(logical)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def guess_mimetype(logical: str) -> str:
+    return mimetypes.guess_type(logical)[0] or "application/octet-stream"
+
+
+def iter_sources(base_dir: Path = BASE_DIR):
+    for root in ASSET_ROOTS:
+        root_dir = base_dir / root
+        if not root_dir.is_dir():
+            continue
+        for path in sorted(root_dir.rglob("*")):
+            if path.is_file():
+                yield path.relative_to(base_dir).as_posix(), path
+
+
+def scan_sources(base_dir: Path = BASE_DIR) -> AssetRegistry:
+    assets = []
+    for logical, path in iter_sources(base_dir):
+        digest = fingerprint(path)
+        assets.append(
+            Asset(
+                logical=logical,
+                url_name=fingerprinted_name(logical, digest),
+                path=path,
+                etag=digest,
+                mimetype=guess_mimetype(logical),
+            )
+        )
+    return AssetRegistry.from_assets(assets)
+
+
+def load_manifest(build_dir: Path) -> Optional[AssetRegistry]:
+    manifest_path = build_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    assets = []
+    for logical, entry in manifest.items():
+        assets.append(
+            Asset(
+                logical=logical,
+                url_name=entry["url_name"],
+                path=build_dir / entry["url_name"],
+                etag=entry["etag"],
+                mimetype=guess_mimetype(logical),
+                encoded={enc: build_dir / name for enc, name in entry.get("encoded", {}).items()},
+            )
+        )
+    return AssetRegistry.from_assets(assets)
+
+
+def build(build_dir: Path = DEFAULT_BUILD_DIR, base_dir: Path = BASE_DIR) -> Dict[str, Dict[str, object]]:
+    """
+    Copy fingerprinted assets into build_dir, precompress text assets and write the manifest.
+    """
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    manifest: Dict[str, Dict[str, object]] = {}
+    for logical, path in iter_sources(base_dir):
+        digest = fingerprint(path)
+        url_name = fingerprinted_name(logical, digest)
+        target = build_dir / url_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+        encoded: Dict[str, str] = {}
+        if path.suffix.lower() in PRECOMPRESS_SUFFIXES:
+            raw = path.read_bytes()
+            variants = {"gzip": (".gz", gzip.compress(raw, compresslevel=9, mtime=0))}
+            if brotli is not None:
+                variants["br"] = (".br", brotli.compress(raw, quality=11))
+            for enc, (suffix, data) in variants.items():
+                # Only keep variants that actually save bytes.
+                if len(data) < len(raw):
+                    target.with_name(target.name + suffix).write_bytes(data)
+                    encoded[enc] = url_name + suffix
+        manifest[logical] = {"url_name": url_name, "etag": digest, "encoded": encoded}
+    build_dir.mkdir(parents=True, exist_ok=True)
+    (build_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def get_registry() -> AssetRegistry:
+    return current_app.extensions["legidb_assets"]
+
+
+def asset_url(logical: str) -> str:
+    asset = get_registry().by_logical.get(logical)
+    if asset is None:
+        # Unknown to the registry (e.g. added after startup): fall back to the plain static route.
+        if logical.startswith("static/"):
+            return url_for("static", filename=logical[len("static/") :])
+        return "/" + logical
+    return url_for("serve_asset", name=asset.url_name)
+
+
+_DOCS_SRC_PATTERN = re.compile(r'(src|href)="/docs/([^"#?]+)"')
+
+
+def rewrite_docs_urls(html: str) -> str:
+    """
+    Point /docs/... references in rendered HTML at their fingerprinted URLs.
+    """
+    return _DOCS_SRC_PATTERN.sub(lambda m: f'{m.group(1)}="{asset_url("docs/" + m.group(2))}"', html)
+
+
+def send_asset(asset: Asset, max_age: int, immutable: bool):
+    encoding = None
+    if asset.encoded:
+        encoding = choose_encoding(
+            request.headers.get("Accept-Encoding", ""),
+            [enc for enc in ("br", "gzip") if enc in asset.encoded],
+        )
+    path = asset.encoded[encoding] if encoding else asset.path
+    response = send_file(
+        path,
+        mimetype=asset.mimetype,
+        conditional=True,
+        etag=f"{asset.etag}-{encoding}" if encoding else asset.etag,
+        max_age=max_age,
+    )
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if asset.encoded:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def serve_asset(name: str):
+    asset = get_registry().by_url.get(name)
+    if asset is None:
+        abort(404)
+    return send_asset(asset, IMMUTABLE_MAX_AGE, immutable=True)
+
+
+def serve_doc(filename: str):
+    asset = get_registry().by_logical.get(f"docs/{filename}")
+    if asset is None:
+        abort(404)
+    return send_asset(asset, DOCS_MAX_AGE, immutable=False)
+
+
+def init_app(app: Flask) -> None:
+    build_dir = Path(app.config.get("ASSETS_BUILD_DIR") or DEFAULT_BUILD_DIR)
+    registry = load_manifest(build_dir) or scan_sources()
+    app.extensions["legidb_assets"] = registry
+    app.add_url_rule("/assets/<path:name>", "serve_asset", serve_asset)
+    app.add_url_rule("/docs/<path:filename>", "docs_static", serve_doc)
+    app.jinja_env.globals["asset_url"] = asset_url
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="Write assets and manifest.json to the build directory.")
+    build_parser.add_argument("--out", type=Path, default=DEFAULT_BUILD_DIR)
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        manifest = build(args.out)
+        print(f"Wrote {len(manifest)} assets to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Versioned, columnar export of the reference data for client-side plan building.
+
+The bundle holds every reference table as {column: [values...]}, which is a fraction
+of the size of row objects, and is addressed by a digest of its content. The plan page
+is rendered with the digest URL, so browsers and CDNs can keep it forever; a new data
+version produces a new digest and therefore a new URL. The serialized body and its
+compressed variants are built once per data version.
+
+Each regulation gets its own bundle holding only its partition of the SM entries and
+group restrictions, so adding regulations does not grow the download for existing ones.
+"""
+import gzip
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, Response, current_app, request, url_for
+
+from .refdata import PARTITIONED_TABLES, REFERENCE_TABLES, ReferenceData, Rows, get_reference_data
+from .regulations import DEFAULT_REGULATION_ID, get_regulation
+from .responses import brotli, choose_encoding, dumps
+from .schema import get_table
+
+BUNDLE_FORMAT = 2
+
+
+@dataclass
+class Bundle:
+    version: int
+    regulation_id: int
+    digest: str
+    body: bytes
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def encode(self, encoding: str) -> bytes:
+        # Compressed once per bundle; concurrent first requests may both compress, harmlessly.
+        body = self.encoded.get(encoding)
+        if body is None:
+            if encoding == "br":
+                body = brotli.compress(self.body)
+            else:
+                body = gzip.compress(self.body, compresslevel=9)
+            self.encoded[encoding] = body
+        return body
+
+
+def columnar(table: str, rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    return {col.name: [row[col.name] for row in rows] for col in get_table(table).columns}
+
+
+def partition_tables(data: ReferenceData, regulation_id: int) -> Dict[str, Rows]:
+    """
+    The reference tables as seen by one regulation.
+    """
+    return {
+        table: data.partition(table, regulation_id) if table in PARTITIONED_TABLES else data.rows(table)
+        for table in REFERENCE_TABLES
+    }
+
+
+def build_bundle(data: ReferenceData, regulation_id: int) -> Bundle:
+    tables = partition_tables(data, regulation_id)
+    body = dumps(
+        {
+            "format": BUNDLE_FORMAT,
+            "version": data.version,
+            "regulation_id": regulation_id,
+            "tables": {table: columnar(table, rows) for table, rows in tables.items()},
+        }
+    )
+    return Bundle(
+        version=data.version,
+        regulation_id=regulation_id,
+        digest=hashlib.sha256(body).hexdigest()[:16],
+        body=body,
+    )
+
+
+class BundleCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._bundles: Dict[int, Bundle] = {}
+
+    def get(self, regulation_id: int) -> Bundle:
+        data = get_reference_data()
+        bundle = self._bundles.get(regulation_id)
+        if bundle is not None and bundle.version == data.version:
+            return bundle
+        with self._lock:
+            bundle = self._bundles.get(regulation_id)
+            if bundle is None or bundle.version != data.version:
+                if any(b.version != data.version for b in self._bundles.values()):
+                    # Bundles of the previous version are never served again.
+                    self._bundles = {}
+                bundle = build_bundle(data, regulation_id)
+                self._bundles[regulation_id] = bundle
+        return bundle
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["legidb_bundle"] = BundleCache()
+
+
+def get_bundle(regulation_id: int = DEFAULT_REGULATION_ID) -> Bundle:
+    return current_app.extensions["legidb_bundle"].get(regulation_id)
+
+
+def bundle_url(regulation_id: int = DEFAULT_REGULATION_ID) -> str:
+    bundle = get_bundle(regulation_id)
+    return url_for("api.bundle_versioned", digest=bundle.digest, **regulation_args(regulation_id))
+
+
+def regulation_args(regulation_id: int) -> Dict[str, Optional[str]]:
+    # Default-regulation URLs stay the same as before regulations existed.
+    if regulation_id == DEFAULT_REGULATION_ID:
+        return {}
+    regulation = get_regulation(regulation_id)
+    return {"regulation": regulation["code"] if regulation else str(regulation_id)}
+
+
+def bundle_response(bundle: Bundle) -> Response:
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    body = bundle.encode(encoding) if encoding else bundle.body
+    response = current_app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(f"{bundle.digest}-{encoding}" if encoding else bundle.digest)
+    response.cache_control.public = True
+    return response
@@ -0,0 +1,337 @@
+"""
+Change log of reference-data writes, served as a delta feed at /api/changes.
+
+Every row written through insert_row()/update_row()/delete_row() or their batched
+*_rows() counterparts is logged in the same transaction as the write, under a
+monotonically increasing version (the change_log auto-increment key). Rows removed by
+ON DELETE CASCADE are logged as deletes too, so downstream copies never keep orphans.
+
+Auto-increment values are handed out at insert time, not at commit. Logged writes must
+therefore run in write_transaction(bump_version=True), which locks the data_version row
+before the first write and holds it until commit. Writers then log one after another,
+and versions become visible in commit order: a client that has seen version N can never
+later be missing a version below N.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .db import get_engine, query
+from .refdata import REFERENCE_TABLES
+from .schema import cascading_children, primary_key_columns
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Keys per SELECT when re-reading rows after a batched write.
+FETCH_CHUNK = 500
+
+
+def ensure_change_log_table() -> None:
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS change_log (
+                  version BIGINT AUTO_INCREMENT PRIMARY KEY,
+                  table_name VARCHAR(64) NOT NULL,
+                  operation VARCHAR(6) NOT NULL,
+                  row_key JSON NOT NULL,
+                  row_data JSON,
+                  changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+        )
+
+
+def _where(key: Dict[str, Any], prefix: str = "pk_") -> Tuple[str, Dict[str, Any]]:
+    clause = " AND ".join(f"{col} = :{prefix}{col}" for col in key)
+    return clause, {f"{prefix}{col}": val for col, val in key.items()}
+
+
+def _fetch_rows(
+    conn: Connection, table: str, keys: List[Dict[str, Any]]
+) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    """
+    Current rows for many keys, fetched FETCH_CHUNK keys per query and indexed by key tuple.
+    """
+    found: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for start in range(0, len(keys), FETCH_CHUNK):
+        clauses = []
+        params: Dict[str, Any] = {}
+        for i, key in enumerate(keys[start : start + FETCH_CHUNK]):
+            clause, key_params = _where(key, prefix=f"k{i}_")
+            clauses.append(f"({clause})")
+            params.update(key_params)
+        result = conn.execute(text(f"SELECT * FROM {table} WHERE {' OR '.join(clauses)}"), params)
+        for row in result.mappings():
+            found[_key_tuple(table, row)] = dict(row)
+    return found
+
+
+def _key_tuple(table: str, key: Dict[str, Any]) -> Tuple[str, ...]:
+    # Compared as strings so keys parsed from form input still match database values.
+    return tuple(str(key.get(col)) for col in primary_key_columns(table))
+
+
+def _typed_key(key: Dict[str, Any], row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Form input arrives as strings; log keys with the column values the database holds.
+    if row is None:
+        return key
+    return {col: row[col] for col in key}
+
+
+ChangeEntry = Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]
+
+
+def record_change(
+    conn: Connection,
+    table: str,
+    operation: str,
+    key: Dict[str, Any],
+    row: Optional[Dict[str, Any]] = None,
+) -> None:
+    record_changes(conn, table, [(operation, key, row)])
+
+
+def record_changes(conn: Connection, table: str, entries: List[ChangeEntry]) -> None:
+    """
+    Log (operation, key, row) entries for `table` with a single batched INSERT.
+    """
+    if table not in REFERENCE_TABLES or not entries:
+        return
+    conn.execute(
+        text(
+            """
+            INSERT INTO change_log (table_name, operation, row_key, row_data)
+            VALUES (:table_name, :operation, :row_key, :row_data)
+            """
+        ),
+        [
+            {
+                "table_name": table,
+                "operation": operation,
+                "row_key": json.dumps(key, default=str),
+                "row_data": json.dumps(row, default=str) if row is not None else None,
+            }
+            for operation, key, row in entries
+        ],
+    )
+
+
+def insert_row(conn: Connection, table: str, values: Dict[str, Any]) -> Dict[str, Any]:
+    return insert_rows(conn, table, [values])[0]
+
+
+def insert_rows(conn: Connection, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Insert rows with one multi-row INSERT per column set (FETCH_CHUNK rows each) and
+    return their keys, in order.
+
+    MariaDB reports the first auto-increment id of a multi-row INSERT, and the rest follow
+    consecutively: reference writers are serialized on the data_version row (see the
+    module docstring), so no other insert can interleave with ours.
+    """
+    if not rows:
+        return []
+    pk_cols = primary_key_columns(table)
+    # A missing or NULL key column means "let the database assign the id".
+    rows = [{col: val for col, val in row.items() if not (col in pk_cols and val is None)} for row in rows]
+    keys: List[Dict[str, Any]] = [{} for _ in rows]
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(tuple(row), []).append(index)
+    for cols, indexes in groups.items():
+        for start in range(0, len(indexes), FETCH_CHUNK):
+            chunk = indexes[start : start + FETCH_CHUNK]
+            values_sql = ", ".join("(" + ", ".join(f":r{n}_{col}" for col in cols) + ")" for n in range(len(chunk)))
+            params = {f"r{n}_{col}": rows[index][col] for n, index in enumerate(chunk) for col in cols}
+            result = conn.execute(text(f"INSERT INTO {table} ({', '.join(cols)}) VALUES {values_sql}"), params)
+            for n, index in enumerate(chunk):
+                key = {col: rows[index][col] for col in pk_cols if col in rows[index]}
+                if len(key) < len(pk_cols):
+                    key = {pk_cols[0]: result.lastrowid + n}
+                keys[index] = key
+    found = _fetch_rows(conn, table, keys)
+    entries: List[ChangeEntry] = []
+    typed_keys = []
+    for key in keys:
+        row = found.get(_key_tuple(table, key))
+        key = _typed_key(key, row)
+        typed_keys.append(key)
+        entries.append(("insert", key, row))
+    record_changes(conn, table, entries)
+    return typed_keys
+
+
+def upsert_rows(conn: Connection, table: str, rows: List[Dict[str, Any]]) -> Tuple[int, int, int]:
+    """
+    Update rows whose full key already exists and insert the rest.
+
+    Returns (inserted, updated, unchanged); existing rows with nothing but key columns
+    (link-table rows) are unchanged.
+    """
+    pk_cols = primary_key_columns(table)
+    keys = [{col: row.get(col) for col in pk_cols} for row in rows]
+    keyed = [key for key in keys if None not in key.values()]
+    found = _fetch_rows(conn, table, keyed) if keyed else {}
+    updates = []
+    inserts = []
+    unchanged = 0
+    for row, key in zip(rows, keys):
+        if None not in key.values() and _key_tuple(table, key) in found:
+            values = {col: val for col, val in row.items() if col not in pk_cols}
+            if values:
+                updates.append((key, values))
+            else:
+                unchanged += 1
+        else:
+            inserts.append(row)
+    insert_rows(conn, table, inserts)
+    update_rows(conn, table, updates)
+    return len(inserts), len(updates), unchanged
+
+
+def update_row(conn: Connection, table: str, key: Dict[str, Any], values: Dict[str, Any]) -> None:
+    update_rows(conn, table, [(key, values)])
+
+
+def update_rows(conn: Connection, table: str, updates: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """
+    Apply (key, values) updates, batching statements that set the same columns.
+    """
+    # Link tables consist only of key columns; there is nothing to update.
+    updates = [(key, values) for key, values in updates if values]
+    batches: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict[str, Any]]] = {}
+    for key, values in updates:
+        batches.setdefault((tuple(values), tuple(key)), []).append({**values, **_where(key)[1]})
+    for (set_cols, key_cols), params in batches.items():
+        set_clause = ", ".join(f"{col} = :{col}" for col in set_cols)
+        clause = " AND ".join(f"{col} = :pk_{col}" for col in key_cols)
+        conn.execute(text(f"UPDATE {table} SET {set_clause} WHERE {clause}"), params)
+    if not updates:
+        return
+    found = _fetch_rows(conn, table, [key for key, _ in updates])
+    entries: List[ChangeEntry] = []
+    for key, _ in updates:
+        row = found.get(_key_tuple(table, key))
+        if row is not None:
+            entries.append(("update", _typed_key(key, row), row))
+    record_changes(conn, table, entries)
+
+
+def delete_row(conn: Connection, table: str, key: Dict[str, Any]) -> None:
+    delete_rows(conn, table, [key])
+
+
+def delete_rows(conn: Connection, table: str, keys: List[Dict[str, Any]]) -> int:
+    """
+    Delete rows by key with one batched DELETE and return how many rows it removed.
+
+    Keys that no longer exist are skipped.
+    """
+    found = _fetch_rows(conn, table, keys) if keys else {}
+    existing = []
+    for key in keys:
+        row = found.pop(_key_tuple(table, key), None)
+        if row is not None:
+            existing.append(_typed_key(key, row))
+    if not existing:
+        return 0
+    _record_cascaded_deletes(conn, table, existing)
+    clause = " AND ".join(f"{col} = :pk_{col}" for col in existing[0])
+    result = conn.execute(text(f"DELETE FROM {table} WHERE {clause}"), [_where(key)[1] for key in existing])
+    record_changes(conn, table, [("delete", key, None) for key in existing])
+    return result.rowcount
+
+
+def _record_cascaded_deletes(conn: Connection, table: str, keys: List[Dict[str, Any]]) -> None:
+    """
+    Log the child rows that ON DELETE CASCADE will remove with `keys`, level by level.
+
+    Each child table is queried FETCH_CHUNK parent keys at a time, however many keys are deleted.
+    """
+    for child, col_pairs in cascading_children(table):
+        child_pk = primary_key_columns(child)
+        child_keys: List[Dict[str, Any]] = []
+        for start in range(0, len(keys), FETCH_CHUNK):
+            clauses = []
+            params: Dict[str, Any] = {}
+            for i, key in enumerate(keys[start : start + FETCH_CHUNK]):
+                clauses.append(
+                    "(" + " AND ".join(f"{child_col} = :k{i}_{child_col}" for child_col, _ in col_pairs) + ")"
+                )
+                params.update({f"k{i}_{child_col}": key.get(parent_col) for child_col, parent_col in col_pairs})
+            rows = conn.execute(
+                text(f"SELECT {', '.join(child_pk)} FROM {child} WHERE {' OR '.join(clauses)}"), params
+            ).mappings()
+            child_keys.extend(dict(r) for r in rows)
+        if not child_keys:
+            continue
+        _record_cascaded_deletes(conn, child, child_keys)
+        record_changes(conn, child, [("delete", child_key, None) for child_key in child_keys])
+
+
+def current_change_version() -> int:
+    rows = query("SELECT MAX(version) AS version FROM change_log")
+    return int(rows[0]["version"] or 0) if rows else 0
+
+
+def _load_json(raw: Any) -> Any:
+    if raw is None or isinstance(raw, (dict, list)):
+        return raw
+    return json.loads(raw)
+
+
+def changes_since(since: int, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Net changes after `since`, grouped per table into inserted/updated rows and deleted keys.
+
+    Several changes to the same row collapse into one entry (a row inserted and deleted
+    within the window is omitted). When `has_more` is set, fetch again from `version`.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = query(
+        """
+        SELECT version, table_name, operation, row_key, row_data
+        FROM change_log
+        WHERE version > :since
+        ORDER BY version
+        LIMIT :limit
+        """,
+        {"since": since, "limit": limit + 1},
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # (table, key json) -> [first operation, last operation, key, latest row]
+    net: Dict[Tuple[str, str], List[Any]] = {}
+    for row in rows:
+        key = _load_json(row["row_key"])
+        ident = (row["table_name"], json.dumps(key, sort_keys=True))
+        entry = net.get(ident)
+        if entry is None:
+            net[ident] = [row["operation"], row["operation"], key, _load_json(row["row_data"])]
+        else:
+            entry[1] = row["operation"]
+            entry[3] = _load_json(row["row_data"])
+
+    tables: Dict[str, Dict[str, List[Any]]] = {}
+    for (table, _), (first_op, last_op, key, data) in net.items():
+        bucket = tables.setdefault(table, {"inserted": [], "updated": [], "deleted": []})
+        if last_op == "delete":
+            if first_op != "insert":
+                bucket["deleted"].append(key)
+        elif first_op == "insert":
+            bucket["inserted"].append(data)
+        else:
+            bucket["updated"].append(data)
+
+    return {
+        "since": since,
+        "version": rows[-1]["version"] if rows else since,
+        "has_more": has_more,
+        "tables": tables,
+    }
@@ -0,0 +1,68 @@
+"""
+Aggregates behind the /charts page.
+
+They are derived from the in-memory reference-data snapshot once per data version
+instead of running GROUP BY scans on every page view. The page itself carries no data
+and loads them from /api/charts, so its HTML can be cached.
+"""
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from flask import Flask, current_app
+
+from .refdata import ReferenceData, get_reference_data
+
+
+def compute_chart_data(data: ReferenceData) -> Dict[str, Any]:
+    foods_per_category = Counter(food["food_category_id"] for food in data.rows("foods"))
+    categories_per_simulant = Counter(link["simulant_id"] for link in data.rows("food_category_simulants"))
+    return {
+        "version": data.version,
+        "foods_per_category": [
+            {
+                "ref_no": cat["ref_no"],
+                "description": cat["description"],
+                "total": foods_per_category[cat["id"]],
+                "frf": cat["frf"],
+            }
+            for cat in sorted(data.rows("food_categories"), key=lambda cat: cat["ref_no"])
+        ],
+        "simulants_per_category": sorted(
+            (
+                {
+                    "abbreviation": sim["abbreviation"],
+                    "name": sim["name"],
+                    "total": categories_per_simulant[sim["id"]],
+                }
+                for sim in data.rows("simulants")
+            ),
+            key=lambda row: (-row["total"], row["abbreviation"]),
+        ),
+    }
+
+
+class ChartCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._charts: Optional[Dict[str, Any]] = None
+
+    def get(self) -> Dict[str, Any]:
+        data = get_reference_data()
+        charts = self._charts
+        if charts is not None and charts["version"] == data.version:
+            return charts
+        with self._lock:
+            charts = self._charts
+            if charts is None or charts["version"] != data.version:
+                charts = compute_chart_data(data)
+                self._charts = charts
+        return charts
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["legidb_charts"] = ChartCache()
+
+
+def get_chart_data() -> Dict[str, Any]:
+    return current_app.extensions["legidb_charts"].get()
@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from .db import execute, get_connection, get_data_version, get_engine, is_read_only, query
+from .plans import PLAN_FORMAT, build_plan, inputs_from_plan, load_temp_conditions, load_time_conditions
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Reference tables that every plan repeats verbatim; they are dropped from stored
+# snapshots and re-attached from the live tables when a snapshot is read back.
+SNAPSHOT_STRIPPED_KEYS = ("time_conditions", "temp_conditions")
+# Records the PLAN_FORMAT a snapshot was built with.
+SNAPSHOT_FORMAT_KEY = "_plan_format"
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def content_hash(inputs: Dict[str, Any]) -> str:
+    # Custom CAS order only affects display, so it does not make a favorite distinct.
+    canonical = {**inputs, "custom_cas_numbers": sorted(inputs.get("custom_cas_numbers") or [])}
+    return hashlib.sha256(canonical_json(canonical).encode("utf-8")).hexdigest()
+
+
+def pack_snapshot(plan: Dict[str, Any]) -> bytes:
+    compact = {key: val for key, val in plan.items() if key not in SNAPSHOT_STRIPPED_KEYS}
+    compact[SNAPSHOT_FORMAT_KEY] = PLAN_FORMAT
+    return zlib.compress(canonical_json(compact).encode("utf-8"), 6)
+
+
+def unpack_snapshot(blob: bytes) -> Optional[Dict[str, Any]]:
+    """
+    The plan stored in a snapshot, or None if it was built for an older PLAN_FORMAT.
+    """
+    plan = json.loads(zlib.decompress(blob).decode("utf-8"))
+    if plan.pop(SNAPSHOT_FORMAT_KEY, None) != PLAN_FORMAT:
+        return None
+    plan["time_conditions"] = load_time_conditions()
+    plan["temp_conditions"] = load_temp_conditions()
+    return plan
+
+
+def _load_payload(raw: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(raw, dict):
+        return raw
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _stored_inputs(raw: Any) -> Optional[Dict[str, Any]]:
+    data = _load_payload(raw)
+    if data is None:
+        return None
+    # Rows written before inputs were stored hold the full generated plan.
+    if "food_ids" not in data:
+        return inputs_from_plan(data)
+    return data
+
+
+def list_favorites(limit: int = DEFAULT_PAGE_SIZE, before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Return one page of favorites, newest first, plus the cursor for the next page.
+
+    Paging is keyset-based on (created_at, id) so deep pages cost the same as the first.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    params: Dict[str, Any] = {"limit": limit + 1}
+    where = ""
+    if before is not None:
+        anchor = query("SELECT id, created_at FROM plan_favorites WHERE id = :id", {"id": before})
+        if not anchor:
+            return [], None
+        where = "WHERE created_at <= :ts AND (created_at < :ts OR id < :id)"
+        params.update({"ts": anchor[0]["created_at"], "id": anchor[0]["id"]})
+    rows = query(
+        f"""
+        SELECT id, name, created_at
+        FROM plan_favorites
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+        """,
+        params,
+    )
+    next_before = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_before = rows[-1]["id"]
+    return rows, next_before
+
+
+def create_favorite(name: str, inputs: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Store a favorite for canonical plan inputs.
+
+    Returns the stored row and whether it was newly created. Favorites are deduplicated
+    by content, not by name: saving inputs that are already stored returns the existing
+    favorite, under its existing name, instead of adding a duplicate. The row is None
+    if a concurrent identical save won the race and was deleted before it could be read.
+    """
+    digest = content_hash(inputs)
+    existing = _find_by_hash(digest)
+    if existing:
+        return existing, False
+    snapshot = None
+    data_version = None
+    if _store_snapshots():
+        # Read the version first: a write landing mid-build only makes the snapshot look older.
+        data_version = get_data_version()
+        snapshot = pack_snapshot(build_plan(inputs))
+    try:
+        execute(
+            """
+            INSERT INTO plan_favorites (name, payload, content_hash, snapshot, data_version)
+            VALUES (:name, :payload, :content_hash, :snapshot, :data_version)
+            """,
+            {
+                "name": name,
+                "payload": canonical_json(inputs),
+                "content_hash": digest,
+                "snapshot": snapshot,
+                "data_version": data_version,
+            },
+        )
+    except IntegrityError:
+        # Lost a race against an identical save; the winner is only certain to be on the primary.
+        return _find_by_hash(digest, primary=True), False
+    return _find_by_hash(digest), True
+
+
+def _find_by_hash(digest: str, *, primary: bool = False) -> Optional[Dict[str, Any]]:
+    sql = "SELECT id, name, created_at FROM plan_favorites WHERE content_hash = :hash"
+    params = {"hash": digest}
+    if primary:
+        row = get_connection().execute(text(sql), params).mappings().first()
+        return dict(row) if row else None
+    rows = query(sql, params)
+    return rows[0] if rows else None
+
+
+def _store_snapshots() -> bool:
+    return bool(current_app.config.get("FAVORITES_STORE_SNAPSHOT", True)) and not is_read_only()
+
+
+def get_favorite(fav_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Load a favorite with its plan computed against the current reference data.
+
+    The stored snapshot is reused while its data version and plan format are current;
+    otherwise the plan is rebuilt from the stored inputs and written back so later reads
+    are cheap again.
+    """
+    rows = query(
+        "SELECT id, name, payload, snapshot, data_version, created_at FROM plan_favorites WHERE id = :id",
+        {"id": fav_id},
+    )
+    if not rows:
+        return None
+    row = rows[0]
+    inputs = _stored_inputs(row["payload"])
+    current_version = get_data_version()
+    plan = None
+    recomputed = False
+    if row["snapshot"] is not None and row["data_version"] == current_version:
+        plan = unpack_snapshot(row["snapshot"])
+    if plan is None and inputs is not None:
+        plan = build_plan(inputs)
+        recomputed = True
+        if _store_snapshots():
+            # A cache refresh, not a user write: a separate primary connection keeps this GET
+            # from being marked as a writer and pinning the client's reads to the primary.
+            with get_engine().begin() as conn:
+                conn.execute(
+                    text(
+                        """
+                        UPDATE plan_favorites
+                        SET snapshot = :snapshot, data_version = :data_version
+                        WHERE id = :id AND (data_version IS NULL OR data_version <= :data_version)
+                        """
+                    ),
+                    {"id": row["id"], "snapshot": pack_snapshot(plan), "data_version": current_version},
+                )
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "created_at": row["created_at"],
+        "inputs": inputs,
+        "plan": plan,
+        "data_version": current_version,
+        "recomputed": recomputed,
+    }
+
+
+def compact_legacy_favorites() -> int:
+    """
+    Rewrite favorites that still hold a full plan payload into inputs + snapshot form.
+
+    A one-off step (`python -m app.favorites compact`); legacy rows are readable without
+    it (see _stored_inputs()). Returns the number of rows rewritten.
+    """
+    rows = query("SELECT id, payload FROM plan_favorites WHERE content_hash IS NULL")
+    update_sql = """
+        UPDATE plan_favorites
+        SET payload = :payload, snapshot = :snapshot, content_hash = :content_hash
+        WHERE id = :id
+    """
+    compacted = 0
+    for row in rows:
+        plan = _load_payload(row["payload"])
+        if plan is None or "food_ids" in plan:
+            continue
+        inputs = inputs_from_plan(plan)
+        digest = content_hash(inputs)
+        # Keep duplicates of an already-hashed favorite, just without a hash of their own.
+        params = {
+            "id": row["id"],
+            "payload": canonical_json(inputs),
+            "snapshot": pack_snapshot(plan),
+            "content_hash": None if _find_by_hash(digest, primary=True) else digest,
+        }
+        # Legacy snapshots keep data_version NULL, so they are rebuilt on first read.
+        try:
+            execute(update_sql, params)
+        except IntegrityError:
+            # A concurrent run or save took the hash first; this row becomes the duplicate.
+            execute(update_sql, {**params, "content_hash": None})
+        compacted += 1
+    return compacted
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Maintenance tasks for saved plan favorites.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compact", help="Rewrite legacy full-plan favorites into inputs + snapshot form.")
+    args = parser.parse_args(argv)
+    if args.command == "compact":
+        from . import create_app
+
+        with create_app().app_context():
+            print(f"Compacted {compact_legacy_favorites()} legacy favorites")
+
+
+if __name__ == "__main__":
+    main()
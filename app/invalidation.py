@@ -0,0 +1,120 @@
+"""
+Cross-process invalidation of caches derived from reference data.
+
+Every worker keeps a VersionWatcher. It re-reads the data_version row at most once per
+DATA_VERSION_POLL_SECONDS (on the request path, no background thread), so no worker
+serves data older than that interval after another worker or node committed a write.
+A notifier can shorten the delay: the worker that wrote publishes the new version, and
+subscribed workers pick it up immediately. LocalNotifier is the in-process stand-in;
+set INVALIDATION_NOTIFIER to "module:factory" to plug in a real pub/sub channel.
+"""
+import importlib
+import threading
+import time
+from typing import Callable, List, Protocol
+
+from flask import Flask, current_app
+
+from .db import get_data_version
+
+VersionCallback = Callable[[int], None]
+
+
+class Notifier(Protocol):
+    def publish(self, version: int) -> None: ...
+
+    def listen(self, callback: VersionCallback) -> None: ...
+
+
+class LocalNotifier:
+    """
+    Delivers published versions to listeners in this process only.
+    """
+
+    def __init__(self) -> None:
+        self._listeners: List[VersionCallback] = []
+
+    def publish(self, version: int) -> None:
+        for callback in list(self._listeners):
+            callback(version)
+
+    def listen(self, callback: VersionCallback) -> None:
+        self._listeners.append(callback)
+
+
+class VersionWatcher:
+    def __init__(self, notifier: Notifier, interval: float) -> None:
+        self._notifier = notifier
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._version: int | None = None
+        self._checked_at = 0.0
+        self._subscribers: List[VersionCallback] = []
+        notifier.listen(self._on_published)
+
+    def subscribe(self, callback: VersionCallback) -> None:
+        """
+        Call `callback(new_version)` whenever the data version moves forward.
+        """
+        self._subscribers.append(callback)
+
+    def current(self) -> int:
+        """
+        The data version, at most `interval` seconds stale.
+        """
+        if self._version is None or time.monotonic() - self._checked_at >= self._interval:
+            self.refresh()
+        return self._version
+
+    def refresh(self) -> int:
+        version = get_data_version()
+        with self._lock:
+            self._checked_at = time.monotonic()
+        self._advance(version)
+        return version
+
+    def publish_local_write(self) -> None:
+        """
+        Pick up a write committed by this process and tell the other processes about it.
+        """
+        self._notifier.publish(self.refresh())
+
+    def _on_published(self, version: int) -> None:
+        self._advance(version)
+
+    def _advance(self, version: int) -> None:
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                return
+            previous, self._version = self._version, version
+        if previous is not None:
+            for callback in list(self._subscribers):
+                callback(version)
+
+
+def load_notifier(spec: str | None) -> Notifier:
+    if not spec:
+        return LocalNotifier()
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+def init_app(app: Flask) -> None:
+    notifier = load_notifier(app.config.get("INVALIDATION_NOTIFIER"))
+    app.extensions["legidb_versions"] = VersionWatcher(
+        notifier,
+        interval=float(app.config.get("DATA_VERSION_POLL_SECONDS", 2.0)),
+    )
+
+
+def get_watcher() -> VersionWatcher:
+    return current_app.extensions["legidb_versions"]
+
+
+def current_data_version() -> int:
+    return get_watcher().current()
+
+
+def subscribe(callback: VersionCallback) -> None:
+    get_watcher().subscribe(callback)
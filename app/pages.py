@@ -1,21 +1,39 @@
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
-from flask import Blueprint, redirect, render_template, request, url_for
+from flask import Blueprint, abort, make_response, redirect, render_template, request, url_for
 
+from .assets import rewrite_docs_urls
+from .bundle import bundle_url
 from .db import query
+from .refdata import get_reference_data
+from .regulations import get_regulation, list_regulations, resolve_regulation
 
 bp = Blueprint("pages", __name__)
 
+CHARTS_PAGE_MAX_AGE = 300
+
+# (mtime_ns, size) of README.md -> rendered HTML; only the latest rendering is kept.
+_readme_cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
 
 def load_readme() -> Tuple[str | None, str | None]:
     """
     Load README.md and return rendered HTML plus an optional error string.
+
+    The rendering is cached until the file's mtime or size changes.
     """
     readme_path = Path(bp.root_path).parent / "README.md"
     try:
+        stat = readme_path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = _readme_cache.get(str(readme_path))
+        if cached and cached[0] == key:
+            return cached[1], None
         raw = readme_path.read_text()
-        return render_markdown_to_html(raw), None
+        html = rewrite_docs_urls(render_markdown_to_html(raw))
+        _readme_cache[str(readme_path)] = (key, html)
+        return html, None
     except FileNotFoundError as exc:
         return None, f"README not found: {exc}"
 
@@ -156,15 +174,7 @@ def render_markdown_to_html(raw: str) -> str:
 
 @bp.route("/")
 def index():
-    rows = query(
-        """
-        SELECT
-          (SELECT COUNT(*) FROM substances) AS substances,
-          (SELECT COUNT(*) FROM foods) AS foods,
-          (SELECT COUNT(*) FROM food_categories) AS categories
-        """
-    )
-    totals = rows[0] if rows else None
+    totals = get_reference_data().totals
     readme_html, readme_error = load_readme()
     return render_template(
         "index.html",
@@ -177,6 +187,9 @@ def index():
 @bp.route("/search")
 def search():
     q = (request.args.get("q") or "").strip()
+    regulation_id = resolve_regulation(request.args.get("regulation"))
+    if regulation_id is None:
+        abort(404)
     substances: List[Dict[str, Any]] = []
     if q:
         like = f"%{q}%"
@@ -187,11 +200,11 @@ def search():
                    se.frf_applicable, se.sml, se.restrictions_and_specifications,
                    se.id AS sm_entry_id
             FROM substances s
-            LEFT JOIN sm_entries se ON se.substance_id = s.id
+            LEFT JOIN sm_entries se ON se.substance_id = s.id AND se.regulation_id = :regulation_id
             WHERE s.cas_no LIKE :like OR CAST(s.fcm_no AS CHAR) LIKE :like OR CAST(s.ec_ref_no AS CHAR) LIKE :like
             ORDER BY s.cas_no
             """,
-            {"like": like},
+            {"like": like, "regulation_id": regulation_id},
         )
         for row in rows:
             group_limits = []
@@ -216,36 +229,27 @@ def search():
                     "sml": row["sml"],
                     "restrictions_and_specifications": row["restrictions_and_specifications"],
                     "group_limits": group_limits,
+                    # Every substance is searchable; those without an entry in this
+                    # regulation are shown as not listed rather than hidden.
+                    "listed": row["sm_entry_id"] is not None,
                 }
             )
-    return render_template("search.html", substances=substances, query=q)
+    return render_template(
+        "search.html",
+        substances=substances,
+        query=q,
+        regulations=list_regulations(),
+        regulation=get_regulation(regulation_id),
+    )
 
 
 @bp.route("/charts")
 def charts():
-    foods_per_category: List[Tuple] = query(
-        """
-        SELECT fc.ref_no, fc.description, COUNT(f.id) as total, fc.frf
-        FROM food_categories fc
-        LEFT JOIN foods f ON f.food_category_id = fc.id
-        GROUP BY fc.id
-        ORDER BY fc.ref_no
-        """
-    )
-    simulants_per_category: List[Tuple] = query(
-        """
-        SELECT s.abbreviation, s.name, COUNT(fcs.food_category_id) as total
-        FROM simulants s
-        LEFT JOIN food_category_simulants fcs ON fcs.simulant_id = s.id
-        GROUP BY s.id
-        ORDER BY total DESC
-        """
-    )
-    return render_template(
-        "charts.html",
-        foods_per_category=foods_per_category,
-        simulants_per_category=simulants_per_category,
-    )
+    # The chart data comes from /api/charts, so the page only changes on deploys.
+    response = make_response(render_template("charts.html"))
+    response.cache_control.public = True
+    response.cache_control.max_age = CHARTS_PAGE_MAX_AGE
+    return response
 
 
 @bp.route("/api")
@@ -261,6 +265,9 @@ def about():
 
 @bp.route("/plan")
 def plan():
+    regulation_id = resolve_regulation(request.args.get("regulation"))
+    if regulation_id is None:
+        abort(404)
     latest_time_rows = query(
         "SELECT worst_case_time_minutes FROM sm_time_conditions ORDER BY worst_case_time_minutes DESC LIMIT 1"
     )
@@ -271,6 +278,9 @@ def plan():
     latest_temp = latest_temp_rows[0] if latest_temp_rows else None
     return render_template(
         "plan.html",
+        bundle_url=bundle_url(regulation_id),
+        regulations=list_regulations(),
+        regulation=get_regulation(regulation_id),
         baseline_time=latest_time["worst_case_time_minutes"] if latest_time else None,
         baseline_temp=latest_temp["worst_case_temp_celsius"] if latest_temp else None,
     )
@@ -0,0 +1,308 @@
+from typing import Any, Dict, List
+
+from .db import query
+from .reduction import reduce_tests
+from .regulations import DEFAULT_REGULATION_ID
+
+UNLISTED_SUBSTANCE_CAS = "UNLISTED_SUBSTANCE"
+
+# Shape of build_plan() output; bump it whenever that output changes so stored snapshots
+# (app.favorites) built by older code are recomputed. 2: reduced_tests, 3: regulation_id.
+PLAN_FORMAT = 3
+
+
+def coerce_int(val):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _unique_ints(values) -> List[int]:
+    seen = set()
+    for raw in values or []:
+        val = coerce_int(raw)
+        if val is not None:
+            seen.add(val)
+    return sorted(seen)
+
+
+def normalize_plan_inputs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a /api/generate-plan request body to its canonical form.
+
+    IDs are de-duplicated and sorted so equivalent requests produce identical inputs;
+    custom CAS numbers and condition rows keep their order because it is the order they
+    are displayed in.
+    `regulation_id` is only kept for regulations other than the default, so inputs
+    saved before regulations existed stay canonical.
+    """
+    custom_cas_numbers = []
+    for raw in payload.get("custom_cas_numbers") or []:
+        cas_no = str(raw).strip()
+        if cas_no and cas_no not in custom_cas_numbers:
+            custom_cas_numbers.append(cas_no)
+
+    condition_inputs = payload.get("conditions")
+    # Support both the legacy single time/temp payload and the new multi-row payload.
+    if isinstance(condition_inputs, list):
+        raw_conditions = condition_inputs
+    else:
+        raw_conditions = [
+            {
+                "worst_case_time_minutes": payload.get("worst_case_time_minutes"),
+                "worst_case_temp_celsius": payload.get("worst_case_temp_celsius"),
+            }
+        ]
+
+    conditions = []
+    for cond in raw_conditions:
+        if not isinstance(cond, dict):
+            continue
+        wc_time_val = coerce_int(cond.get("worst_case_time_minutes"))
+        input_time_raw = coerce_int(cond.get("input_time_raw"))
+        conditions.append(
+            {
+                "worst_case_time_minutes": wc_time_val,
+                "worst_case_temp_celsius": coerce_int(cond.get("worst_case_temp_celsius")),
+                "input_time_raw": input_time_raw if input_time_raw is not None else wc_time_val,
+                "input_time_unit": cond.get("input_time_unit") or "minutes",
+            }
+        )
+
+    inputs = {
+        "food_ids": _unique_ints(payload.get("food_ids")),
+        "substance_ids": _unique_ints(payload.get("substance_ids")),
+        "custom_cas_numbers": custom_cas_numbers,
+        "conditions": conditions,
+    }
+    regulation_id = coerce_int(payload.get("regulation_id"))
+    if regulation_id is not None and regulation_id != DEFAULT_REGULATION_ID:
+        inputs["regulation_id"] = regulation_id
+    return inputs
+
+
+def inputs_from_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Recover the canonical inputs from a plan previously returned by build_plan().
+    """
+    substance_ids = []
+    custom_cas_numbers = []
+    for sub in plan.get("substances") or []:
+        if not isinstance(sub, dict):
+            continue
+        if sub.get("unlisted_fallback"):
+            custom_cas_numbers.append(sub.get("cas_no"))
+        elif sub.get("id") is not None:
+            substance_ids.append(sub["id"])
+    conditions = plan.get("conditions")
+    if not isinstance(conditions, list):
+        conditions = None
+    return normalize_plan_inputs(
+        {
+            "food_ids": [f.get("id") for f in plan.get("foods") or [] if isinstance(f, dict)],
+            "substance_ids": substance_ids,
+            "custom_cas_numbers": custom_cas_numbers,
+            "conditions": conditions,
+            "worst_case_time_minutes": plan.get("worst_case_time_minutes"),
+            "worst_case_temp_celsius": plan.get("worst_case_temp_celsius"),
+            "regulation_id": plan.get("regulation_id"),
+        }
+    )
+
+
+def load_time_conditions() -> List[Dict[str, Any]]:
+    return [dict(row) for row in query("SELECT * FROM sm_time_conditions ORDER BY worst_case_time_minutes")]
+
+
+def load_temp_conditions() -> List[Dict[str, Any]]:
+    return [dict(row) for row in query("SELECT * FROM sm_temp_conditions ORDER BY worst_case_temp_celsius")]
+
+
+def build_plan(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the analysis plan for canonical inputs (see normalize_plan_inputs()).
+    """
+    food_ids = inputs["food_ids"]
+    substance_ids = inputs["substance_ids"]
+    custom_cas_numbers = inputs["custom_cas_numbers"]
+    regulation_id = inputs.get("regulation_id", DEFAULT_REGULATION_ID)
+
+    foods = []
+    if food_ids:
+        placeholders = ", ".join(f":food_id_{i}" for i in range(len(food_ids)))
+        rows = query(
+            f"""
+            SELECT f.id, f.name, fc.id as category_id, fc.ref_no, fc.description, fc.frf, fc.acidic
+            FROM foods f
+            JOIN food_categories fc ON fc.id = f.food_category_id
+            WHERE f.id IN ({placeholders})
+            """,
+            {f"food_id_{i}": fid for i, fid in enumerate(food_ids)},
+        )
+        for row in rows:
+            simulants = query(
+                """
+                SELECT s.name, s.abbreviation
+                FROM simulants s
+                JOIN food_category_simulants fcs ON fcs.simulant_id = s.id
+                WHERE fcs.food_category_id = :cat_id
+                """,
+                {"cat_id": row["category_id"]},
+            )
+            foods.append(
+                {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "ref_no": row["ref_no"],
+                    "description": row["description"],
+                    "frf": row["frf"],
+                    "acidic": bool(row["acidic"]),
+                    "simulants": [dict(sim) for sim in simulants],
+                }
+            )
+
+    def to_bool(val):
+        return bool(val) if val is not None else None
+
+    def get_group_limits(sm_entry_id):
+        if not sm_entry_id:
+            return []
+        return query(
+            """
+            SELECT gr.id AS group_restriction_id, gr.group_sml, gr.unit, gr.specification
+            FROM group_restrictions gr
+            JOIN sm_entry_group_restrictions sgr ON sgr.group_restriction_id = gr.id
+            WHERE sgr.sm_id = :sm_id
+            """,
+            {"sm_id": sm_entry_id},
+        )
+
+    def serialize_substance(row, *, unique_key, cas_override=None, extra=None):
+        group_limits = get_group_limits(row.get("sm_entry_id"))
+        payload = {
+            "id": row.get("id"),
+            "cas_no": cas_override if cas_override is not None else row.get("cas_no"),
+            "fcm_no": row.get("fcm_no"),
+            "ec_ref_no": row.get("ec_ref_no"),
+            "use_as_additive_or_ppa": to_bool(row.get("use_as_additive_or_ppa")),
+            "use_as_monomer_or_starting_substance": to_bool(row.get("use_as_monomer_or_starting_substance")),
+            "frf_applicable": to_bool(row.get("frf_applicable")),
+            "sml": row.get("sml"),
+            "restrictions_and_specifications": row.get("restrictions_and_specifications"),
+            "group_limits": [dict(gl) for gl in group_limits],
+            "unique_key": unique_key,
+        }
+        if extra:
+            payload.update(extra)
+        return payload
+
+    substances_details = []
+    if substance_ids:
+        placeholders = ", ".join(f":sub_id_{i}" for i in range(len(substance_ids)))
+        subs = query(
+            f"""
+            SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no,
+                   se.id AS sm_entry_id,
+                   se.use_as_additive_or_ppa,
+                   se.use_as_monomer_or_starting_substance,
+                   se.frf_applicable,
+                   se.sml,
+                   se.restrictions_and_specifications
+            FROM substances s
+            LEFT JOIN sm_entries se ON se.substance_id = s.id AND se.regulation_id = :regulation_id
+            WHERE s.id IN ({placeholders})
+            """,
+            {"regulation_id": regulation_id, **{f"sub_id_{i}": sid for i, sid in enumerate(substance_ids)}},
+        )
+        for row in subs:
+            substances_details.append(serialize_substance(row, unique_key=f"db:{row['id']}"))
+
+    def load_unlisted_template():
+        rows = query(
+            """
+            SELECT s.id, s.cas_no, s.fcm_no, s.ec_ref_no,
+                   se.id AS sm_entry_id,
+                   se.use_as_additive_or_ppa,
+                   se.use_as_monomer_or_starting_substance,
+                   se.frf_applicable,
+                   se.sml,
+                   se.restrictions_and_specifications
+            FROM substances s
+            LEFT JOIN sm_entries se ON se.substance_id = s.id AND se.regulation_id = :regulation_id
+            WHERE s.cas_no = :cas_no
+            LIMIT 1
+            """,
+            {"cas_no": UNLISTED_SUBSTANCE_CAS, "regulation_id": regulation_id},
+        )
+        # Regulations without an entry for the template fall back to the built-in default.
+        if rows and rows[0]["sm_entry_id"] is not None:
+            return serialize_substance(rows[0], unique_key="unlisted-template")
+        return {
+            "id": None,
+            "cas_no": UNLISTED_SUBSTANCE_CAS,
+            "fcm_no": None,
+            "ec_ref_no": None,
+            "use_as_additive_or_ppa": None,
+            "use_as_monomer_or_starting_substance": None,
+            "frf_applicable": None,
+            "sml": 0.01,
+            "restrictions_and_specifications": "Default limit for non-listed substances.",
+            "group_limits": [],
+            "unique_key": "unlisted-template",
+        }
+
+    if custom_cas_numbers:
+        base_unlisted = load_unlisted_template()
+        for cas_no in custom_cas_numbers:
+            substances_details.append(
+                {
+                    **base_unlisted,
+                    "cas_no": cas_no,
+                    "unique_key": f"custom:{cas_no}",
+                    "unlisted_fallback": True,
+                    "source_substance_id": base_unlisted.get("id"),
+                    "source_substance_cas": base_unlisted.get("cas_no"),
+                    "group_limits": [dict(gl) for gl in base_unlisted.get("group_limits", [])],
+                }
+            )
+
+    time_conditions = load_time_conditions()
+    temp_conditions = load_temp_conditions()
+
+    def pick_condition(value, rows, key):
+        if value is None or not rows:
+            return None
+        for row in rows:
+            if value <= row[key]:
+                return row
+        return rows[-1]
+
+    condition_results = []
+    for cond in inputs["conditions"]:
+        wc_time_val = cond["worst_case_time_minutes"]
+        wc_temp_val = cond["worst_case_temp_celsius"]
+        condition_results.append(
+            {
+                **cond,
+                "selected_time_condition": pick_condition(wc_time_val, time_conditions, "worst_case_time_minutes"),
+                "selected_temp_condition": pick_condition(wc_temp_val, temp_conditions, "worst_case_temp_celsius"),
+            }
+        )
+
+    # Keep legacy keys for backward compatibility (first row only).
+    first_cond = condition_results[0] if condition_results else {"worst_case_time_minutes": None, "worst_case_temp_celsius": None, "selected_time_condition": None, "selected_temp_condition": None}
+
+    return {
+        "regulation_id": regulation_id,
+        "foods": foods,
+        "substances": substances_details,
+        "time_conditions": time_conditions,
+        "temp_conditions": temp_conditions,
+        "conditions": condition_results,
+        "reduced_tests": reduce_tests(foods, condition_results),
+        "selected_time_condition": first_cond["selected_time_condition"],
+        "selected_temp_condition": first_cond["selected_temp_condition"],
+        "worst_case_time_minutes": first_cond["worst_case_time_minutes"],
+        "worst_case_temp_celsius": first_cond["worst_case_temp_celsius"],
+    }
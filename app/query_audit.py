@@ -0,0 +1,326 @@
+"""
+Query-plan regression checks for the statements behind the hot endpoints.
+
+`python -m app.query_audit seed --scale 500` adds a synthetic, scaled copy of the
+reference data to the database at DATABASE_URL (meant for the throwaway instance from
+scripts/start_ephemeral_mariadb.sh, never a real one). `python -m app.query_audit check`
+then requests every hot page and API endpoint through the app, records the SQL they
+actually issue, runs EXPLAIN on each distinct SELECT and fails when one reads more than
+--max-rows rows through a full table or index scan, or sorts that many with a filesort.
+
+Statements that are accepted for now can be recorded with --write-baseline and passed
+back with --baseline, so only new slow queries fail the check.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, text
+
+from .db import DEFAULT_DATABASE_URL, bump_data_version
+from .refdata import REFERENCE_TABLES
+
+DEFAULT_SCALE = 500
+DEFAULT_MAX_ROWS = 1000
+SEED_BATCH = 1000
+
+# (label, method, path, JSON body); {food_id} and {substance_id} are filled from the data.
+HOT_REQUESTS: List[Tuple[str, str, str, Optional[Dict[str, Any]]]] = [
+    ("index", "GET", "/", None),
+    ("plan page", "GET", "/plan", None),
+    ("charts page", "GET", "/charts", None),
+    ("search", "GET", "/search?q=0000", None),
+    ("foods", "GET", "/api/foods", None),
+    ("food", "GET", "/api/foods/{food_id}", None),
+    ("substances", "GET", "/api/substances", None),
+    ("regulation substances", "GET", "/api/substances?regulation=EU-10/2011", None),
+    ("suggest foods", "GET", "/api/suggest/foods?q=wat", None),
+    ("suggest substances", "GET", "/api/suggest/substances?q=0000", None),
+    (
+        "generate plan",
+        "POST",
+        "/api/generate-plan",
+        {
+            "food_ids": ["{food_id}"],
+            "substance_ids": ["{substance_id}"],
+            "custom_cas_numbers": ["0000050-00-0"],
+            "conditions": [{"worst_case_time_minutes": 120, "worst_case_temp_celsius": 40}],
+        },
+    ),
+    ("favorites", "GET", "/api/favorites", None),
+    ("changes", "GET", "/api/changes?since=0", None),
+    ("chart data", "GET", "/api/charts", None),
+    ("bundle", "GET", "/api/bundle", None),
+]
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBERED_PLACEHOLDERS = re.compile(r"%\((\w+?)_\d+\)s(?:\s*,\s*%\(\1_\d+\)s)*")
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Collapse whitespace and variable-length IN lists so one query shape maps to one key.
+    """
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _NUMBERED_PLACEHOLDERS.sub(r"%(\1_n)s", statement)
+
+
+# Whole-table reads that are intentional: the reference-data snapshot loads every table
+# once per data version.
+INTENTIONAL_FULL_SCANS = {normalize_statement(sql) for sql in REFERENCE_TABLES.values()}
+
+
+def fill_placeholders(value: Any, sample: Dict[str, int]) -> Any:
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return sample[value[1:-1]]
+    if isinstance(value, list):
+        return [fill_placeholders(item, sample) for item in value]
+    if isinstance(value, dict):
+        return {key: fill_placeholders(item, sample) for key, item in value.items()}
+    return value
+
+
+@dataclass
+class Statement:
+    sql: str
+    params: Any
+    label: str
+
+
+@dataclass
+class Finding:
+    statement: Statement
+    table: str
+    access: str
+    rows: int
+    extra: str
+
+    def describe(self) -> str:
+        return f"[{self.statement.label}] {self.table}: type={self.access} rows={self.rows} extra={self.extra or '-'}"
+
+
+@dataclass
+class Recorder:
+    label: str = ""
+    statements: Dict[str, Statement] = field(default_factory=dict)
+
+    def __call__(self, _conn, _cursor, statement, parameters, _context, _executemany) -> None:
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return
+        key = normalize_statement(statement)
+        if key not in self.statements:
+            self.statements[key] = Statement(statement, parameters, self.label)
+
+
+def seed_scaled_data(dsn: str, scale: int, seed: int = 0) -> Dict[str, int]:
+    """
+    Append `scale` categories with five foods each and twenty substances per category.
+
+    Rows are marked with an AUD/AUDIT prefix and bypass the change log; the data version
+    is bumped once so running apps reload their caches.
+    """
+    rng = random.Random(seed)
+    engine = create_engine(dsn, future=True)
+    counts: Dict[str, int] = {}
+
+    def insert(conn, table: str, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        cols = list(rows[0])
+        sql = text(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)})")
+        for start in range(0, len(rows), SEED_BATCH):
+            conn.execute(sql, rows[start : start + SEED_BATCH])
+        counts[table] = counts.get(table, 0) + len(rows)
+
+    def ids(conn, table: str, where: str = "") -> List[int]:
+        return [row[0] for row in conn.execute(text(f"SELECT id FROM {table} {where} ORDER BY id"))]
+
+    with engine.begin() as conn:
+        offset = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM food_categories")).scalar()
+        fcm_offset = conn.execute(text("SELECT COALESCE(MAX(fcm_no), 0) FROM substances")).scalar()
+        insert(
+            conn,
+            "food_categories",
+            [
+                {
+                    "ref_no": f"AUD{offset + i:06d}",
+                    "description": f"Audit category {offset + i}",
+                    "acidic": rng.randint(0, 1),
+                    "frf": rng.choice([None, 1, 2, 3, 4, 5]),
+                }
+                for i in range(1, scale + 1)
+            ],
+        )
+        category_ids = ids(conn, "food_categories", "WHERE ref_no LIKE 'AUD%'")[-scale:]
+        simulant_ids = ids(conn, "simulants")
+        insert(
+            conn,
+            "foods",
+            [
+                {"name": f"Audit food {cat_id}-{n}", "food_category_id": cat_id}
+                for cat_id in category_ids
+                for n in range(5)
+            ],
+        )
+        insert(
+            conn,
+            "food_category_simulants",
+            [
+                {"food_category_id": cat_id, "simulant_id": sim_id}
+                for cat_id in category_ids
+                for sim_id in rng.sample(simulant_ids, min(2, len(simulant_ids)))
+            ],
+        )
+        insert(
+            conn,
+            "substances",
+            [
+                {
+                    "cas_no": f"AUDIT-{fcm_offset + i}",
+                    "fcm_no": fcm_offset + i,
+                    "ec_ref_no": rng.randint(10000, 99999),
+                }
+                for i in range(1, scale * 20 + 1)
+            ],
+        )
+        substance_ids = ids(conn, "substances", "WHERE cas_no LIKE 'AUDIT-%'")[-scale * 20 :]
+        insert(
+            conn,
+            "sm_entries",
+            [
+                {
+                    "substance_id": sub_id,
+                    "fcm_no": None,
+                    "use_as_additive_or_ppa": rng.randint(0, 1),
+                    "use_as_monomer_or_starting_substance": rng.randint(0, 1),
+                    "frf_applicable": rng.randint(0, 1),
+                    "sml": str(rng.choice([0.05, 0.6, 1.5, 6, 60])),
+                    "restrictions_and_specifications": None,
+                }
+                for sub_id in substance_ids
+            ],
+        )
+        insert(
+            conn,
+            "group_restrictions",
+            [
+                {"group_sml": rng.choice([0.6, 1.2, 5, 30]), "unit": "mg/kg", "specification": f"Audit group {i}"}
+                for i in range(scale)
+            ],
+        )
+        group_ids = ids(conn, "group_restrictions", "WHERE specification LIKE 'Audit group %'")[-scale:]
+        sm_ids = ids(conn, "sm_entries", f"WHERE substance_id >= {min(substance_ids)}")
+        insert(
+            conn,
+            "sm_entry_group_restrictions",
+            [
+                {"sm_id": sm_id, "group_restriction_id": rng.choice(group_ids)}
+                for sm_id in sm_ids
+                if rng.random() < 0.2
+            ],
+        )
+        bump_data_version(conn)
+    with engine.begin() as conn:
+        # Fresh statistics, so EXPLAIN estimates reflect the scaled tables.
+        for table in REFERENCE_TABLES:
+            conn.execute(text(f"ANALYZE TABLE {table}"))
+    return counts
+
+
+def collect_statements(dsn: str) -> Dict[str, Statement]:
+    """
+    Drive HOT_REQUESTS through the app against `dsn` and record the SELECTs they issue.
+    """
+    os.environ["DATABASE_URL"] = dsn
+    # Audit the primary only; replicas and snapshots would hide the statements.
+    for var in ("DATABASE_REPLICA_URLS", "LEGIDB_SNAPSHOT"):
+        os.environ.pop(var, None)
+
+    from . import create_app
+    from .db import get_engine
+
+    app = create_app()
+    recorder = Recorder()
+    with app.app_context():
+        engine = get_engine()
+        with engine.connect() as conn:
+            sample = {
+                "food_id": conn.execute(text("SELECT MIN(id) FROM foods")).scalar() or 1,
+                "substance_id": conn.execute(text("SELECT MIN(id) FROM substances")).scalar() or 1,
+            }
+        event.listen(engine, "before_cursor_execute", recorder)
+    client = app.test_client()
+    for label, method, path, body in HOT_REQUESTS:
+        recorder.label = label
+        response = client.open(path.format(**sample), method=method, json=fill_placeholders(body, sample))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+    return recorder.statements
+
+
+def explain(dsn: str, statements: Dict[str, Statement], max_rows: int) -> List[Finding]:
+    findings = []
+    engine = create_engine(dsn, future=True)
+    with engine.connect() as conn:
+        for key, stmt in statements.items():
+            if key in INTENTIONAL_FULL_SCANS:
+                continue
+            result = conn.exec_driver_sql("EXPLAIN " + stmt.sql, stmt.params or {})
+            for row in result.mappings():
+                access = row.get("type") or ""
+                extra = row.get("Extra") or ""
+                rows = int(row.get("rows") or 0)
+                full_scan = access in ("ALL", "index")
+                if (full_scan or "filesort" in extra) and rows > max_rows:
+                    findings.append(Finding(stmt, row.get("table") or "", access, rows, extra))
+    return findings
+
+
+def load_baseline(path: Optional[Path]) -> set:
+    if path is None or not path.exists():
+        return set()
+    return set(json.loads(path.read_text()))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Check the query plans of the hot SQL statements.")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL)
+    sub = parser.add_subparsers(dest="command", required=True)
+    seed_parser = sub.add_parser("seed", help="Add a scaled synthetic dataset (ephemeral databases only).")
+    seed_parser.add_argument("--scale", type=int, default=DEFAULT_SCALE)
+    check_parser = sub.add_parser("check", help="EXPLAIN every hot statement and fail on large scans or sorts.")
+    check_parser.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS)
+    check_parser.add_argument("--baseline", type=Path, help="JSON list of accepted statements.")
+    check_parser.add_argument("--write-baseline", type=Path, help="Record the current findings as accepted.")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        counts = seed_scaled_data(args.dsn, args.scale)
+        print("Seeded " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+        return
+
+    statements = collect_statements(args.dsn)
+    findings = explain(args.dsn, statements, args.max_rows)
+    if args.write_baseline:
+        accepted = sorted({normalize_statement(f.statement.sql) for f in findings})
+        args.write_baseline.write_text(json.dumps(accepted, indent=2) + "\n")
+        print(f"Recorded {len(accepted)} accepted statements in {args.write_baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    failures = [f for f in findings if normalize_statement(f.statement.sql) not in baseline]
+    print(f"Checked {len(statements)} statements; {len(findings)} over {args.max_rows} rows, {len(failures)} new.")
+    for finding in failures:
+        print(f"FAIL {finding.describe()}\n  {normalize_statement(finding.statement.sql)}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Reduction of a multi-food plan to the fewest migration tests.
+
+Every selected food has to be tested in each simulant linked to its category, at the
+testing time and temperature selected for every condition. A test that is at least as
+long and at least as hot as a requirement also covers it, so requirements shared by
+many foods and conditions collapse into a handful of (simulant, time, temperature) tests.
+
+Requirements are numbered and each candidate test carries the set it covers as a bitset
+(a Python int), so coverage checks cost one AND per candidate regardless of how many foods
+are selected. The cover is chosen greedily after dropping dominated candidates; because
+coverage is two-dimensional dominance within a simulant, the remaining candidates are
+the Pareto-maximal tests and greedy selection returns exactly those, a minimum cover.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+# (testing_time_minutes, testing_temp_celsius)
+Severity = Tuple[int, int]
+
+
+@dataclass
+class Candidate:
+    simulant: str
+    severity: Severity
+    mask: int
+
+
+def requirement_masks(
+    foods: List[Dict[str, Any]], conditions: List[Dict[str, Any]]
+) -> Tuple[List[Tuple[int, int]], Dict[str, Dict[Severity, int]], Dict[str, str]]:
+    """
+    Number every (food, condition, simulant) requirement.
+
+    Returns the (food_id, condition_index) of each requirement bit, the bits grouped by
+    simulant and severity, and simulant names by abbreviation. Conditions without a
+    matched time or temperature rule produce no requirements.
+    """
+    requirements: List[Tuple[int, int]] = []
+    by_simulant: Dict[str, Dict[Severity, int]] = {}
+    names: Dict[str, str] = {}
+    for cond_index, cond in enumerate(conditions):
+        time_cond = cond.get("selected_time_condition")
+        temp_cond = cond.get("selected_temp_condition")
+        if not time_cond or not temp_cond:
+            continue
+        severity = (time_cond["testing_time_minutes"], temp_cond["testing_temp_celsius"])
+        for food in foods:
+            for sim in food.get("simulants") or []:
+                bit = 1 << len(requirements)
+                requirements.append((food["id"], cond_index))
+                masks = by_simulant.setdefault(sim["abbreviation"], {})
+                masks[severity] = masks.get(severity, 0) | bit
+                names[sim["abbreviation"]] = sim["name"]
+    return requirements, by_simulant, names
+
+
+def candidate_tests(by_simulant: Dict[str, Dict[Severity, int]]) -> List[Candidate]:
+    """
+    One candidate per required severity, covering every requirement it dominates.
+
+    Candidates whose coverage is contained in another candidate's are dropped.
+    """
+    candidates = []
+    for simulant, masks in by_simulant.items():
+        covering = []
+        for severity in masks:
+            mask = 0
+            for other, bits in masks.items():
+                if other[0] <= severity[0] and other[1] <= severity[1]:
+                    mask |= bits
+            covering.append(Candidate(simulant, severity, mask))
+        for cand in covering:
+            dominated = any(
+                other is not cand and other.mask | cand.mask == other.mask and other.mask != cand.mask
+                for other in covering
+            )
+            if not dominated:
+                candidates.append(cand)
+    return candidates
+
+
+def greedy_cover(candidates: List[Candidate], universe: int) -> List[Tuple[Candidate, int]]:
+    """
+    Pick candidates until `universe` is covered; returns (candidate, newly covered bits).
+    """
+    remaining = list(candidates)
+    uncovered = universe
+    chosen = []
+    while uncovered and remaining:
+        best = max(
+            remaining,
+            # Most new requirements first, then widest coverage, then the mildest test.
+            key=lambda c: ((c.mask & uncovered).bit_count(), c.mask.bit_count(), -c.severity[0], -c.severity[1]),
+        )
+        gained = best.mask & uncovered
+        if not gained:
+            break
+        chosen.append((best, gained))
+        uncovered &= ~best.mask
+        remaining.remove(best)
+    return chosen
+
+
+def reduce_tests(foods: List[Dict[str, Any]], conditions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The `reduced_tests` section of a plan built by plans.build_plan().
+    """
+    requirements, by_simulant, names = requirement_masks(foods, conditions)
+    chosen = greedy_cover(candidate_tests(by_simulant), (1 << len(requirements)) - 1)
+
+    tests = []
+    for cand, gained in chosen:
+        covers = []
+        while gained:
+            low = gained & -gained
+            food_id, cond_index = requirements[low.bit_length() - 1]
+            covers.append({"food_id": food_id, "condition_index": cond_index})
+            gained ^= low
+        tests.append(
+            {
+                "simulant": cand.simulant,
+                "simulant_name": names[cand.simulant],
+                "testing_time_minutes": cand.severity[0],
+                "testing_temp_celsius": cand.severity[1],
+                "covers": covers,
+            }
+        )
+    tests.sort(key=lambda t: (t["simulant"], t["testing_time_minutes"], t["testing_temp_celsius"]))
+    return {"requirements": len(requirements), "tests": tests}
@@ -0,0 +1,127 @@
+"""
+In-process snapshot of the reference tables, reloaded when the data version changes.
+
+The version comes from app.invalidation, so a write on any worker or node is picked up
+here within DATA_VERSION_POLL_SECONDS. The tables are then read from the primary in one
+transaction together with the data_version row, and the snapshot is labelled with the
+version it actually contains: a lagging replica could otherwise hand back pre-write rows
+that would be cached under the new version until the next write.
+
+Rows that belong to a single regulation are also grouped by regulation_id once per
+version, so per-regulation readers only walk their own.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, current_app
+from sqlalchemy import text
+
+from .db import get_engine
+from .invalidation import current_data_version, subscribe
+
+Rows = List[Dict[str, Any]]
+
+REFERENCE_TABLES = {
+    "regulations": "SELECT * FROM regulations ORDER BY id",
+    "food_categories": "SELECT * FROM food_categories ORDER BY ref_no",
+    "foods": "SELECT * FROM foods ORDER BY name",
+    "simulants": "SELECT * FROM simulants ORDER BY abbreviation",
+    "food_category_simulants": "SELECT * FROM food_category_simulants",
+    "substances": "SELECT * FROM substances ORDER BY cas_no",
+    "sm_entries": "SELECT * FROM sm_entries",
+    "group_restrictions": "SELECT * FROM group_restrictions",
+    "sm_entry_group_restrictions": "SELECT * FROM sm_entry_group_restrictions",
+    "sm_time_conditions": "SELECT * FROM sm_time_conditions ORDER BY worst_case_time_minutes",
+    "sm_temp_conditions": "SELECT * FROM sm_temp_conditions ORDER BY worst_case_temp_celsius",
+}
+
+# Tables holding one regulation's data (see app.regulations); the link table follows its SM entry.
+PARTITIONED_TABLES = ("sm_entries", "group_restrictions", "sm_entry_group_restrictions")
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    version: int
+    tables: Dict[str, Rows]
+    partitions: Dict[str, Dict[int, Rows]] = field(default_factory=dict)
+
+    def rows(self, table: str) -> Rows:
+        return self.tables[table]
+
+    def partition(self, table: str, regulation_id: int) -> Rows:
+        return self.partitions[table].get(regulation_id, [])
+
+    @property
+    def totals(self) -> Dict[str, int]:
+        return {
+            "substances": len(self.tables["substances"]),
+            "foods": len(self.tables["foods"]),
+            "categories": len(self.tables["food_categories"]),
+        }
+
+
+class ReferenceDataCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Optional[ReferenceData] = None
+
+    def get(self) -> ReferenceData:
+        version = current_data_version()
+        data = self._data
+        # A snapshot may be newer than the watcher if a write landed while it was loading.
+        if data is not None and data.version >= version:
+            return data
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock.
+            data = self._data
+            if data is None or data.version < version:
+                data = load_reference_data()
+                self._data = data
+        return data
+
+    def clear(self, _version: int | None = None) -> None:
+        with self._lock:
+            self._data = None
+
+
+def partition_by_regulation(tables: Dict[str, Rows]) -> Dict[str, Dict[int, Rows]]:
+    entry_regulations = {row["id"]: row["regulation_id"] for row in tables["sm_entries"]}
+    partitions: Dict[str, Dict[int, Rows]] = {table: {} for table in PARTITIONED_TABLES}
+    for table in PARTITIONED_TABLES:
+        for row in tables[table]:
+            if table == "sm_entry_group_restrictions":
+                regulation_id = entry_regulations.get(row["sm_id"])
+            else:
+                regulation_id = row["regulation_id"]
+            partitions[table].setdefault(regulation_id, []).append(row)
+    return partitions
+
+
+def load_reference_data() -> ReferenceData:
+    """
+    Read every reference table and the data version they belong to from the primary.
+
+    All reads share one transaction (one consistent snapshot on InnoDB), so the label
+    can neither run ahead of nor lag behind the rows.
+    """
+    with get_engine().connect() as conn, conn.begin():
+        row = conn.execute(text("SELECT version FROM data_version WHERE id = 1")).first()
+        tables = {
+            table: [dict(r) for r in conn.execute(text(sql)).mappings().all()]
+            for table, sql in REFERENCE_TABLES.items()
+        }
+    version = int(row[0]) if row else 0
+    return ReferenceData(version=version, tables=tables, partitions=partition_by_regulation(tables))
+
+
+def init_app(app: Flask) -> None:
+    cache = ReferenceDataCache()
+    app.extensions["legidb_refdata"] = cache
+    with app.app_context():
+        # Drop the snapshot as soon as a newer version is seen rather than on next use.
+        subscribe(cache.clear)
+
+
+def get_reference_data() -> ReferenceData:
+    return current_app.extensions["legidb_refdata"].get()
@@ -0,0 +1,100 @@
+"""
+Regulations whose annex data the database holds.
+
+Substance identities, foods, simulants and the Annex V condition tables are shared.
+Each regulation's SM entries and group restrictions form a separate partition keyed by
+regulation_id, indexed with regulation_id alongside the lookup column, so queries for
+one regulation never scan another's rows. Requests name a regulation by its code
+(`?regulation=EU-10/2011`) and fall back to the default one.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+
+from .db import get_engine
+from .refdata import get_reference_data
+
+DEFAULT_REGULATION_ID = 1
+DEFAULT_REGULATION_CODE = "EU-10/2011"
+DEFAULT_REGULATION_TITLE = "Commission Regulation (EU) No 10/2011"
+
+# Tables carrying a regulation_id column and the indexes their partitions are read through.
+PARTITION_INDEXES = {
+    "sm_entries": {
+        "idx_sm_entries_regulation": "regulation_id, substance_id",
+        "idx_sm_entries_substance_regulation": "substance_id, regulation_id",
+    },
+    "group_restrictions": {"idx_group_restrictions_regulation": "regulation_id"},
+}
+
+
+def ensure_regulations_table() -> None:
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS regulations (
+                  id INT AUTO_INCREMENT PRIMARY KEY,
+                  code VARCHAR(50) NOT NULL UNIQUE,
+                  title VARCHAR(255) NOT NULL
+                )
+                """
+            )
+        )
+        conn.execute(
+            text("INSERT IGNORE INTO regulations (id, code, title) VALUES (:id, :code, :title)"),
+            {"id": DEFAULT_REGULATION_ID, "code": DEFAULT_REGULATION_CODE, "title": DEFAULT_REGULATION_TITLE},
+        )
+    for table, indexes in PARTITION_INDEXES.items():
+        columns = {col["name"] for col in inspect(engine).get_columns(table)}
+        if "regulation_id" in columns:
+            continue
+        clauses = [f"ADD COLUMN regulation_id INT NOT NULL DEFAULT {DEFAULT_REGULATION_ID}"]
+        clauses += [f"ADD KEY {name} ({cols})" for name, cols in indexes.items()]
+        clauses.append(
+            f"ADD CONSTRAINT fk_{table}_regulation "
+            "FOREIGN KEY (regulation_id) REFERENCES regulations(id) ON DELETE CASCADE"
+        )
+        # Existing rows all belong to the regulation the app was built around.
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} " + ", ".join(clauses)))
+
+
+def list_regulations() -> List[Dict[str, Any]]:
+    return get_reference_data().rows("regulations")
+
+
+def get_regulation(regulation_id: int) -> Optional[Dict[str, Any]]:
+    for reg in list_regulations():
+        if reg["id"] == regulation_id:
+            return reg
+    return None
+
+
+def resolve_regulation(value: Any) -> Optional[int]:
+    """
+    Id of the regulation named by `value` (a code or an id); None if there is no such one.
+
+    Missing or blank values select the default regulation.
+    """
+    if value is None or not str(value).strip():
+        return DEFAULT_REGULATION_ID
+    wanted = str(value).strip().lower()
+    for reg in list_regulations():
+        if reg["code"].lower() == wanted or str(reg["id"]) == wanted:
+            return reg["id"]
+    return None
+
+
+def payload_regulation(payload: Dict[str, Any]) -> Optional[int]:
+    """
+    Regulation of a plan request body: its `regulation` code, else the `regulation_id`
+    carried by inputs and plans returned earlier, else the default.
+
+    None if the named regulation does not exist.
+    """
+    value = payload.get("regulation")
+    if value is None or not str(value).strip():
+        value = payload.get("regulation_id")
+    return resolve_regulation(value)
@@ -0,0 +1,118 @@
+import gzip
+from typing import Any, Iterable, List, Tuple
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional codec
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+}
+
+
+def init_app(app: Flask) -> None:
+    app.json.compact = True
+    app.after_request(compress_response)
+
+
+def dumps(payload: Any) -> bytes:
+    """
+    Serialize to compact JSON, using orjson when it is installed.
+
+    Types orjson does not know natively (Decimal, dates) go through Flask's provider
+    default so both paths produce the same values.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=current_app.json.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return current_app.json.dumps(payload).encode("utf-8")
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    return json_body_response(dumps(payload), status)
+
+
+def json_body_response(body: bytes, status: int = 200) -> Response:
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+def accepted_encodings(header: str) -> List[Tuple[str, float]]:
+    encodings = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings.append((name, quality))
+    return encodings
+
+
+def available_encodings() -> List[str]:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(header: str, candidates: Iterable[str] | None = None) -> str | None:
+    """
+    Pick the codec the client prefers among candidates (default: the codecs we can produce).
+    """
+    offered = dict(accepted_encodings(header))
+    if candidates is None:
+        candidates = available_encodings()
+    best = None
+    best_quality = 0.0
+    for name in candidates:
+        quality = offered.get(name, offered.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress sizeable text responses with the best codec the client accepts.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < current_app.config.get("COMPRESS_MIN_SIZE", 1024):
+        return response
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=current_app.config.get("COMPRESS_BROTLI_QUALITY", 5))
+    elif encoding == "gzip":
+        compressed = gzip.compress(body, compresslevel=current_app.config.get("COMPRESS_GZIP_LEVEL", 6))
+    else:
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The encoded body differs per codec, so a strong validator no longer holds.
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,149 @@
+"""
+Reflected metadata for the reference tables, loaded once per process.
+
+Reflection goes through information_schema and costs several catalog queries per table,
+so it runs at startup (after the bootstrap migrations) instead of on every admin page
+view. Anything that alters a reference table must call reload_schema() afterwards.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, current_app
+from sqlalchemy import inspect
+from sqlalchemy import types as sqltypes
+
+from .db import get_engine
+from .refdata import REFERENCE_TABLES
+
+
+@dataclass(frozen=True)
+class ForeignKey:
+    columns: Tuple[str, ...]
+    table: str
+    referred_columns: Tuple[str, ...]
+    ondelete: str
+
+
+@dataclass(frozen=True)
+class ColumnInfo:
+    name: str
+    sql_type: str
+    # One of "int", "decimal", "bool", "datetime", "text".
+    kind: str
+    nullable: bool
+    primary_key: bool
+    length: Optional[int]
+    # (table, column) this column references, if it is a single-column foreign key.
+    references: Optional[Tuple[str, str]]
+
+
+@dataclass(frozen=True)
+class TableInfo:
+    name: str
+    columns: Tuple[ColumnInfo, ...]
+    primary_key: Tuple[str, ...]
+    foreign_keys: Tuple[ForeignKey, ...]
+
+    def column(self, name: str) -> ColumnInfo:
+        for col in self.columns:
+            if col.name == name:
+                return col
+        raise KeyError(name)
+
+
+def column_kind(col_type: sqltypes.TypeEngine) -> str:
+    if isinstance(col_type, sqltypes.Boolean):
+        return "bool"
+    if isinstance(col_type, sqltypes.Integer):
+        # MariaDB reports BOOLEAN columns as TINYINT(1).
+        return "bool" if getattr(col_type, "display_width", None) == 1 else "int"
+    if isinstance(col_type, sqltypes.Numeric):
+        return "decimal"
+    if isinstance(col_type, (sqltypes.DateTime, sqltypes.Date)):
+        return "datetime"
+    return "text"
+
+
+def reflect_table(inspector, table: str) -> TableInfo:
+    pk = tuple(inspector.get_pk_constraint(table)["constrained_columns"])
+    foreign_keys = tuple(
+        ForeignKey(
+            columns=tuple(fk["constrained_columns"]),
+            table=fk["referred_table"],
+            referred_columns=tuple(fk["referred_columns"]),
+            ondelete=((fk.get("options") or {}).get("ondelete") or "").upper(),
+        )
+        for fk in inspector.get_foreign_keys(table)
+    )
+    references = {
+        fk.columns[0]: (fk.table, fk.referred_columns[0]) for fk in foreign_keys if len(fk.columns) == 1
+    }
+    columns = tuple(
+        ColumnInfo(
+            name=col["name"],
+            sql_type=str(col["type"]),
+            kind=column_kind(col["type"]),
+            nullable=col.get("nullable", True),
+            primary_key=col["name"] in pk,
+            length=getattr(col["type"], "length", None),
+            references=references.get(col["name"]),
+        )
+        for col in inspector.get_columns(table)
+    )
+    return TableInfo(name=table, columns=columns, primary_key=pk, foreign_keys=foreign_keys)
+
+
+def reflect_schema() -> Dict[str, TableInfo]:
+    with get_engine().connect() as conn:
+        inspector = inspect(conn)
+        return {table: reflect_table(inspector, table) for table in REFERENCE_TABLES}
+
+
+class SchemaCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tables: Optional[Dict[str, TableInfo]] = None
+
+    def tables(self) -> Dict[str, TableInfo]:
+        tables = self._tables
+        if tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._tables = reflect_schema()
+                tables = self._tables
+        return tables
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tables = None
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["legidb_schema"] = SchemaCache()
+
+
+def get_table(table: str) -> TableInfo:
+    return current_app.extensions["legidb_schema"].tables()[table]
+
+
+def reload_schema() -> None:
+    cache: SchemaCache = current_app.extensions["legidb_schema"]
+    cache.clear()
+    cache.tables()
+
+
+def primary_key_columns(table: str) -> List[str]:
+    return list(get_table(table).primary_key)
+
+
+def cascading_children(table: str) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """
+    Tables whose rows are deleted with `table`, as (child, [(child_col, parent_col), ...]).
+    """
+    children = []
+    for child in REFERENCE_TABLES:
+        for fk in get_table(child).foreign_keys:
+            if fk.table == table and fk.ondelete == "CASCADE":
+                children.append((child, list(zip(fk.columns, fk.referred_columns))))
+    return children
@@ -0,0 +1,85 @@
+"""
+Coalescing of identical concurrent reads.
+
+When several requests for the same endpoint and the same normalized inputs arrive while
+one of them is still being computed, the later ones wait for that computation and reuse
+its serialized body instead of running the same queries again. Nothing is kept once the
+computation finishes, so this only flattens bursts; it is not a cache.
+
+Coalescing is per worker process. The key includes the data version and whether the
+caller's reads are pinned to the primary, so a request never receives a body built from
+older data than it would have read itself.
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from flask import Flask, current_app
+
+from .db import reads_pinned_to_primary
+from .invalidation import current_data_version
+from .responses import dumps
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless a call with the same key is in flight; returns (result, shared).
+
+        Exceptions raised by the leading call are re-raised in every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def init_app(app: Flask) -> None:
+    app.extensions["legidb_singleflight"] = SingleFlight()
+
+
+def request_key(endpoint: str, inputs: Any = None) -> Tuple[Any, ...]:
+    return (
+        endpoint,
+        json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str),
+        current_data_version(),
+        reads_pinned_to_primary(),
+    )
+
+
+def coalesced_json(endpoint: str, inputs: Any, compute: Callable[[], Any]) -> bytes:
+    """
+    JSON body for `compute()`, shared with identical requests already in flight.
+    """
+    flight: SingleFlight = current_app.extensions["legidb_singleflight"]
+    body, _shared = flight.do(request_key(endpoint, inputs), lambda: dumps(compute()))
+    return body
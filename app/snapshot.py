@@ -0,0 +1,94 @@
+"""
+Read-only SQLite snapshots of the reference data.
+
+`python -m app.snapshot export legidb.sqlite` copies every reference table from the
+MariaDB at DATABASE_URL into a single indexed SQLite file. Pointing LEGIDB_SNAPSHOT at
+that file starts the app in read-only mode: /api reads, /search and the planner are
+served from the file (memory-mapped, opened immutable) without a database server.
+"""
+import argparse
+import os
+import sqlite3
+from decimal import Decimal
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from .db import DEFAULT_DATABASE_URL, SQLITE_SCHEMA
+from .refdata import REFERENCE_TABLES
+
+SNAPSHOT_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_foods_category ON foods (food_category_id);
+CREATE INDEX IF NOT EXISTS idx_foods_name ON foods (name);
+CREATE INDEX IF NOT EXISTS idx_fcs_simulant ON food_category_simulants (simulant_id);
+CREATE INDEX IF NOT EXISTS idx_sm_entries_substance_regulation ON sm_entries (substance_id, regulation_id);
+CREATE INDEX IF NOT EXISTS idx_sm_entries_regulation ON sm_entries (regulation_id, substance_id);
+CREATE INDEX IF NOT EXISTS idx_group_restrictions_regulation ON group_restrictions (regulation_id);
+CREATE INDEX IF NOT EXISTS idx_segr_group ON sm_entry_group_restrictions (group_restriction_id);
+CREATE INDEX IF NOT EXISTS idx_time_worst_case ON sm_time_conditions (worst_case_time_minutes);
+CREATE INDEX IF NOT EXISTS idx_temp_worst_case ON sm_temp_conditions (worst_case_temp_celsius);
+"""
+
+
+def snapshot_dsn(path: str | Path) -> str:
+    return f"sqlite:///file:{Path(path).resolve()}?mode=ro&immutable=1&uri=true"
+
+
+def _sqlite_value(value):
+    # sqlite3 cannot bind Decimal (MariaDB DECIMAL columns).
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_snapshot(source_dsn: str, target: Path) -> int:
+    """
+    Copy the reference tables from source_dsn into a fresh SQLite file at target.
+
+    The file is written next to target and renamed into place, so nodes serving the
+    previous snapshot never see a half-written file. Returns the exported data version.
+    """
+    tmp_path = target.with_name(target.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    source = create_engine(source_dsn, future=True)
+    out = sqlite3.connect(tmp_path)
+    try:
+        out.executescript(SQLITE_SCHEMA)
+        with source.connect() as conn:
+            for table, sql in REFERENCE_TABLES.items():
+                result = conn.execute(text(sql))
+                columns = list(result.keys())
+                placeholders = ", ".join("?" for _ in columns)
+                out.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                    ([_sqlite_value(v) for v in row] for row in result),
+                )
+            version_row = conn.execute(text("SELECT version FROM data_version WHERE id = 1")).first()
+        version = int(version_row[0]) if version_row else 0
+        out.execute("UPDATE data_version SET version = ? WHERE id = 1", (version,))
+        out.executescript(SNAPSHOT_INDEXES)
+        out.commit()
+        out.execute("ANALYZE")
+        out.execute("VACUUM")
+    finally:
+        out.close()
+        source.dispose()
+    os.replace(tmp_path, target)
+    return version
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export the reference data into a read-only SQLite snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="Write a snapshot file.")
+    export_parser.add_argument("target", type=Path)
+    export_parser.add_argument("--source", default=os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL)
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        version = export_snapshot(args.source, args.target)
+        print(f"Wrote snapshot of data version {version} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -38,6 +38,14 @@ CREATE TABLE IF NOT EXISTS substances (
   ec_ref_no INT NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS regulations (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  code VARCHAR(50) NOT NULL UNIQUE,
+  title VARCHAR(255) NOT NULL
+);
+
+INSERT IGNORE INTO regulations (id, code, title) VALUES (1, 'EU-10/2011', 'Commission Regulation (EU) No 10/2011');
+
 CREATE TABLE IF NOT EXISTS sm_entries (
   id INT AUTO_INCREMENT PRIMARY KEY,
   substance_id INT NOT NULL,
@@ -47,14 +55,21 @@ CREATE TABLE IF NOT EXISTS sm_entries (
   frf_applicable BOOLEAN NOT NULL,
   sml VARCHAR(255),
   restrictions_and_specifications TEXT,
-  FOREIGN KEY (substance_id) REFERENCES substances(id) ON DELETE CASCADE
+  regulation_id INT NOT NULL DEFAULT 1,
+  KEY idx_sm_entries_regulation (regulation_id, substance_id),
+  KEY idx_sm_entries_substance_regulation (substance_id, regulation_id),
+  FOREIGN KEY (substance_id) REFERENCES substances(id) ON DELETE CASCADE,
+  FOREIGN KEY (regulation_id) REFERENCES regulations(id) ON DELETE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS group_restrictions (
   id INT AUTO_INCREMENT PRIMARY KEY,
   group_sml DECIMAL(18,6) NOT NULL,
   unit VARCHAR(30) NOT NULL,
-  specification VARCHAR(255)
+  specification VARCHAR(255),
+  regulation_id INT NOT NULL DEFAULT 1,
+  KEY idx_group_restrictions_regulation (regulation_id),
+  FOREIGN KEY (regulation_id) REFERENCES regulations(id) ON DELETE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS sm_entry_group_restrictions (
@@ -83,5 +98,26 @@ CREATE TABLE IF NOT EXISTS plan_favorites (
   id INT AUTO_INCREMENT PRIMARY KEY,
   name VARCHAR(255) NOT NULL,
   payload JSON NOT NULL,
-  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+  content_hash CHAR(64),
+  snapshot MEDIUMBLOB,
+  data_version BIGINT,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_favorite_content (content_hash),
+  KEY idx_plan_favorites_created_at (created_at, id)
+);
+
+CREATE TABLE IF NOT EXISTS data_version (
+  id INT PRIMARY KEY,
+  version BIGINT NOT NULL
+);
+
+INSERT IGNORE INTO data_version (id, version) VALUES (1, 1);
+
+CREATE TABLE IF NOT EXISTS change_log (
+  version BIGINT AUTO_INCREMENT PRIMARY KEY,
+  table_name VARCHAR(64) NOT NULL,
+  operation VARCHAR(6) NOT NULL,
+  row_key JSON NOT NULL,
+  row_data JSON,
+  changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -15,6 +15,8 @@
           sqlalchemy
           pymysql
           markdown
+          orjson
+          brotli
         ]);
 
         mariadb = pkgs.mariadb;
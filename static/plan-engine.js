@@ -0,0 +1,398 @@
+/*
+ * Client-side suggestions and plan building from the reference-data bundle (/api/bundle).
+ *
+ * Mirrors app/api.py (suggest endpoints), app/plans.py (normalize_plan_inputs, build_plan)
+ * and app/reduction.py so the plan page can work without a round trip per keystroke.
+ * Keep the three in step when the server logic changes.
+ */
+(function (global) {
+  'use strict';
+
+  const UNLISTED_SUBSTANCE_CAS = 'UNLISTED_SUBSTANCE';
+  const SUGGESTION_LIMIT = 8;
+
+  function toRows(columns) {
+    const names = Object.keys(columns || {});
+    const length = names.length ? columns[names[0]].length : 0;
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+      const row = {};
+      names.forEach(name => { row[name] = columns[name][i]; });
+      rows[i] = row;
+    }
+    return rows;
+  }
+
+  function groupBy(rows, key) {
+    const groups = new Map();
+    rows.forEach(row => {
+      const bucket = groups.get(row[key]);
+      if (bucket) bucket.push(row);
+      else groups.set(row[key], [row]);
+    });
+    return groups;
+  }
+
+  function coerceInt(val) {
+    if (val === null || val === undefined) return null;
+    if (typeof val === 'boolean') return val ? 1 : 0;
+    if (typeof val === 'number') return Number.isFinite(val) ? Math.trunc(val) : null;
+    if (typeof val === 'string' && /^\s*[-+]?\d+\s*$/.test(val)) return parseInt(val, 10);
+    return null;
+  }
+
+  function uniqueInts(values) {
+    const seen = new Set();
+    (Array.isArray(values) ? values : []).forEach(raw => {
+      const val = coerceInt(raw);
+      if (val !== null) seen.add(val);
+    });
+    return Array.from(seen).sort((a, b) => a - b);
+  }
+
+  function toBool(val) {
+    return val === null || val === undefined ? null : Boolean(val);
+  }
+
+  function byText(key) {
+    return (a, b) => {
+      const x = String(a[key] ?? '').toLowerCase();
+      const y = String(b[key] ?? '').toLowerCase();
+      return x < y ? -1 : x > y ? 1 : 0;
+    };
+  }
+
+  function contains(value, needle) {
+    return value !== null && value !== undefined && String(value).toLowerCase().includes(needle);
+  }
+
+  function normalizePlanInputs(payload) {
+    const customCas = [];
+    (payload.custom_cas_numbers || []).forEach(raw => {
+      const cas = String(raw).trim();
+      if (cas && !customCas.includes(cas)) customCas.push(cas);
+    });
+
+    const rawConditions = Array.isArray(payload.conditions)
+      ? payload.conditions
+      : [{
+          worst_case_time_minutes: payload.worst_case_time_minutes,
+          worst_case_temp_celsius: payload.worst_case_temp_celsius,
+        }];
+    const conditions = [];
+    rawConditions.forEach(cond => {
+      if (!cond || typeof cond !== 'object' || Array.isArray(cond)) return;
+      const wcTime = coerceInt(cond.worst_case_time_minutes);
+      const rawTime = coerceInt(cond.input_time_raw);
+      conditions.push({
+        worst_case_time_minutes: wcTime,
+        worst_case_temp_celsius: coerceInt(cond.worst_case_temp_celsius),
+        input_time_raw: rawTime !== null ? rawTime : wcTime,
+        input_time_unit: cond.input_time_unit || 'minutes',
+      });
+    });
+
+    return {
+      food_ids: uniqueInts(payload.food_ids),
+      substance_ids: uniqueInts(payload.substance_ids),
+      custom_cas_numbers: customCas,
+      conditions,
+    };
+  }
+
+  function bitCount(mask) {
+    let count = 0;
+    for (const digit of mask.toString(2)) {
+      if (digit === '1') count++;
+    }
+    return count;
+  }
+
+  function reduceTests(foods, conditions) {
+    const requirements = [];
+    const bySimulant = new Map();
+    const names = new Map();
+    conditions.forEach((cond, condIndex) => {
+      const timeCond = cond.selected_time_condition;
+      const tempCond = cond.selected_temp_condition;
+      if (!timeCond || !tempCond) return;
+      const severity = `${timeCond.testing_time_minutes}|${tempCond.testing_temp_celsius}`;
+      foods.forEach(food => {
+        (food.simulants || []).forEach(sim => {
+          const bit = 1n << BigInt(requirements.length);
+          requirements.push([food.id, condIndex]);
+          if (!bySimulant.has(sim.abbreviation)) bySimulant.set(sim.abbreviation, new Map());
+          const masks = bySimulant.get(sim.abbreviation);
+          masks.set(severity, (masks.get(severity) || 0n) | bit);
+          names.set(sim.abbreviation, sim.name);
+        });
+      });
+    });
+
+    const candidates = [];
+    bySimulant.forEach((masks, simulant) => {
+      const covering = [];
+      masks.forEach((_bits, severity) => {
+        const [time, temp] = severity.split('|').map(Number);
+        let mask = 0n;
+        masks.forEach((bits, other) => {
+          const [otherTime, otherTemp] = other.split('|').map(Number);
+          if (otherTime <= time && otherTemp <= temp) mask |= bits;
+        });
+        covering.push({ simulant, time, temp, mask });
+      });
+      covering.forEach(cand => {
+        const dominated = covering.some(other => other !== cand && (other.mask | cand.mask) === other.mask && other.mask !== cand.mask);
+        if (!dominated) candidates.push(cand);
+      });
+    });
+
+    let uncovered = (1n << BigInt(requirements.length)) - 1n;
+    const remaining = candidates.slice();
+    const tests = [];
+    while (uncovered && remaining.length) {
+      let best = null;
+      let bestKey = null;
+      remaining.forEach(cand => {
+        const key = [bitCount(cand.mask & uncovered), bitCount(cand.mask), -cand.time, -cand.temp];
+        if (bestKey === null || compareKeys(key, bestKey) > 0) {
+          best = cand;
+          bestKey = key;
+        }
+      });
+      let gained = best.mask & uncovered;
+      if (!gained) break;
+      uncovered &= ~best.mask;
+      remaining.splice(remaining.indexOf(best), 1);
+      const covers = [];
+      const digits = gained.toString(2);
+      for (let i = 0; i < digits.length; i++) {
+        if (digits[digits.length - 1 - i] === '1') {
+          const [foodId, condIndex] = requirements[i];
+          covers.push({ food_id: foodId, condition_index: condIndex });
+        }
+      }
+      tests.push({
+        simulant: best.simulant,
+        simulant_name: names.get(best.simulant),
+        testing_time_minutes: best.time,
+        testing_temp_celsius: best.temp,
+        covers,
+      });
+    }
+    tests.sort((a, b) => (
+      a.simulant < b.simulant ? -1 : a.simulant > b.simulant ? 1
+        : (a.testing_time_minutes - b.testing_time_minutes) || (a.testing_temp_celsius - b.testing_temp_celsius)
+    ));
+    return { requirements: requirements.length, tests };
+  }
+
+  function compareKeys(a, b) {
+    for (let i = 0; i < a.length; i++) {
+      if (a[i] !== b[i]) return a[i] > b[i] ? 1 : -1;
+    }
+    return 0;
+  }
+
+  class PlanEngine {
+    constructor(bundle) {
+      const tables = {};
+      Object.entries(bundle.tables).forEach(([name, columns]) => { tables[name] = toRows(columns); });
+      this.version = bundle.version;
+      // The bundle only holds this regulation's SM entries and group restrictions.
+      this.regulationId = bundle.regulation_id;
+      this.categories = new Map(tables.food_categories.map(row => [row.id, row]));
+      this.foods = tables.foods.slice().sort(byText('name'));
+      this.foodsById = new Map(tables.foods.map(row => [row.id, row]));
+      this.simulants = new Map(tables.simulants.map(row => [row.id, row]));
+      this.simulantLinks = groupBy(tables.food_category_simulants, 'food_category_id');
+      this.substances = tables.substances.slice().sort(byText('cas_no'));
+      this.substancesById = new Map(tables.substances.map(row => [row.id, row]));
+      this.smEntries = groupBy(tables.sm_entries, 'substance_id');
+      this.groupRestrictions = new Map(tables.group_restrictions.map(row => [row.id, row]));
+      this.groupLinks = groupBy(tables.sm_entry_group_restrictions, 'sm_id');
+      this.timeConditions = tables.sm_time_conditions.slice().sort((a, b) => a.worst_case_time_minutes - b.worst_case_time_minutes);
+      this.tempConditions = tables.sm_temp_conditions.slice().sort((a, b) => a.worst_case_temp_celsius - b.worst_case_temp_celsius);
+    }
+
+    static async load(url) {
+      const res = await fetch(url);
+      if (!res.ok) throw new Error(`Could not load data bundle (${res.status})`);
+      return new PlanEngine(await res.json());
+    }
+
+    suggestFoods(q) {
+      const needle = q.trim().toLowerCase();
+      const items = [];
+      for (const food of this.foods) {
+        const cat = this.categories.get(food.food_category_id);
+        if (!cat) continue;
+        if (contains(food.name, needle) || contains(cat.ref_no, needle)) {
+          items.push({
+            id: food.id,
+            label: `${food.name} (Annex III ${cat.ref_no})`,
+            ref_no: cat.ref_no,
+            name: food.name,
+          });
+          if (items.length === SUGGESTION_LIMIT) break;
+        }
+      }
+      return items;
+    }
+
+    suggestSubstances(q) {
+      const needle = q.trim().toLowerCase();
+      const items = [];
+      for (const sub of this.substances) {
+        // The bundle holds one regulation's entries; unlisted substances are not suggested.
+        if (!this.smEntries.has(sub.id)) continue;
+        if (contains(sub.cas_no, needle) || contains(sub.fcm_no, needle) || contains(sub.ec_ref_no, needle)) {
+          items.push({
+            id: sub.id,
+            label: `CAS ${sub.cas_no} · FCM ${sub.fcm_no} · EC ${sub.ec_ref_no}`,
+            cas_no: sub.cas_no,
+          });
+          if (items.length === SUGGESTION_LIMIT) break;
+        }
+      }
+      return items;
+    }
+
+    simulantsFor(categoryId) {
+      return (this.simulantLinks.get(categoryId) || [])
+        .map(link => this.simulants.get(link.simulant_id))
+        .filter(Boolean)
+        .map(sim => ({ name: sim.name, abbreviation: sim.abbreviation }));
+    }
+
+    groupLimits(smEntryId) {
+      if (!smEntryId) return [];
+      return (this.groupLinks.get(smEntryId) || [])
+        .map(link => this.groupRestrictions.get(link.group_restriction_id))
+        .filter(Boolean)
+        .map(gr => ({
+          group_restriction_id: gr.id,
+          group_sml: gr.group_sml,
+          unit: gr.unit,
+          specification: gr.specification,
+        }));
+    }
+
+    substanceRows(sub) {
+      // Same rows as `substances LEFT JOIN sm_entries`.
+      const entries = this.smEntries.get(sub.id);
+      return entries && entries.length ? entries.map(entry => [sub, entry]) : [[sub, null]];
+    }
+
+    serializeSubstance(sub, entry, uniqueKey) {
+      return {
+        id: sub.id,
+        cas_no: sub.cas_no,
+        fcm_no: sub.fcm_no,
+        ec_ref_no: sub.ec_ref_no,
+        use_as_additive_or_ppa: toBool(entry?.use_as_additive_or_ppa),
+        use_as_monomer_or_starting_substance: toBool(entry?.use_as_monomer_or_starting_substance),
+        frf_applicable: toBool(entry?.frf_applicable),
+        sml: entry ? entry.sml : null,
+        restrictions_and_specifications: entry ? entry.restrictions_and_specifications : null,
+        group_limits: this.groupLimits(entry?.id),
+        unique_key: uniqueKey,
+      };
+    }
+
+    unlistedTemplate() {
+      const sub = this.substances.find(row => row.cas_no === UNLISTED_SUBSTANCE_CAS);
+      const entry = sub ? this.substanceRows(sub)[0][1] : null;
+      if (entry) return this.serializeSubstance(sub, entry, 'unlisted-template');
+      return {
+        id: null,
+        cas_no: UNLISTED_SUBSTANCE_CAS,
+        fcm_no: null,
+        ec_ref_no: null,
+        use_as_additive_or_ppa: null,
+        use_as_monomer_or_starting_substance: null,
+        frf_applicable: null,
+        sml: 0.01,
+        restrictions_and_specifications: 'Default limit for non-listed substances.',
+        group_limits: [],
+        unique_key: 'unlisted-template',
+      };
+    }
+
+    buildPlan(payload) {
+      const inputs = normalizePlanInputs(payload || {});
+
+      const foods = [];
+      inputs.food_ids.forEach(id => {
+        const food = this.foodsById.get(id);
+        const cat = food && this.categories.get(food.food_category_id);
+        if (!cat) return;
+        foods.push({
+          id: food.id,
+          name: food.name,
+          ref_no: cat.ref_no,
+          description: cat.description,
+          frf: cat.frf,
+          acidic: Boolean(cat.acidic),
+          simulants: this.simulantsFor(cat.id),
+        });
+      });
+
+      const substances = [];
+      inputs.substance_ids.forEach(id => {
+        const sub = this.substancesById.get(id);
+        if (!sub) return;
+        this.substanceRows(sub).forEach(([row, entry]) => {
+          substances.push(this.serializeSubstance(row, entry, `db:${row.id}`));
+        });
+      });
+      if (inputs.custom_cas_numbers.length) {
+        const base = this.unlistedTemplate();
+        inputs.custom_cas_numbers.forEach(cas => {
+          substances.push({
+            ...base,
+            cas_no: cas,
+            unique_key: `custom:${cas}`,
+            unlisted_fallback: true,
+            source_substance_id: base.id,
+            source_substance_cas: base.cas_no,
+            group_limits: base.group_limits.map(gl => ({ ...gl })),
+          });
+        });
+      }
+
+      const pickCondition = (value, rows, key) => {
+        if (value === null || !rows.length) return null;
+        return rows.find(row => value <= row[key]) || rows[rows.length - 1];
+      };
+      const conditions = inputs.conditions.map(cond => ({
+        ...cond,
+        selected_time_condition: pickCondition(cond.worst_case_time_minutes, this.timeConditions, 'worst_case_time_minutes'),
+        selected_temp_condition: pickCondition(cond.worst_case_temp_celsius, this.tempConditions, 'worst_case_temp_celsius'),
+      }));
+      const first = conditions[0] || {
+        worst_case_time_minutes: null,
+        worst_case_temp_celsius: null,
+        selected_time_condition: null,
+        selected_temp_condition: null,
+      };
+
+      return {
+        regulation_id: this.regulationId,
+        foods,
+        substances,
+        time_conditions: this.timeConditions,
+        temp_conditions: this.tempConditions,
+        conditions,
+        reduced_tests: reduceTests(foods, conditions),
+        selected_time_condition: first.selected_time_condition,
+        selected_temp_condition: first.selected_temp_condition,
+        worst_case_time_minutes: first.worst_case_time_minutes,
+        worst_case_temp_celsius: first.worst_case_temp_celsius,
+      };
+    }
+  }
+
+  PlanEngine.normalizePlanInputs = normalizePlanInputs;
+  global.PlanEngine = PlanEngine;
+})(window);